@@ -1,74 +1,129 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file
-import boto3
-from botocore.client import Config
-import urllib3
-import random
-import string
-import os
-
-# Suppress only the single InsecureRequestWarning from urllib3 needed
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
-# AWS S3 credentials and endpoint
-aws_access_key = ''
-aws_secret_access_key = ''
-endpoint_url = 'https://s3.amazonaws.com'
-bucket_name = 'breaker19er-test'
-
-# Initialize S3 client
-s3 = boto3.client(
-    's3',
-    aws_access_key_id=aws_access_key,
-    aws_secret_access_key=aws_secret_access_key,
-    endpoint_url=endpoint_url,
-    config=Config(signature_version='s3v4'),
-    verify=False
-)
+from flask import Flask, render_template, request, redirect, url_for, flash, Response, jsonify
+from botocore.exceptions import ClientError
+import s3_client
+import s3_bulk
+import s3_transfer
+import loadgen
+import prefix_stats
+import web_helpers
+from web_helpers import parse_page_size, get_breadcrumbs
+from jobs import JobRegistry
+import metrics
+from listing_cache import ListingCache, MISSING
+
+# Shared S3 client and bucket (see s3_client.py for the settings)
+settings = s3_client.load_settings()
+bucket_name = settings['bucket_name']
+s3 = s3_client.get_client()
+
+# Listing page size (entries per page in the index view)
+page_size = 1000
+max_page_size = 5000
+
+# Cached listings expire after this many seconds; at most this many pages are kept
+listing_cache_ttl = 30
+listing_cache_size = 1024
+listing_cache = ListingCache(ttl=listing_cache_ttl, max_entries=listing_cache_size)
+
+# Concurrent server-side copies for copy/move/rename of folders
+copy_workers = 16
+
+# Folder statistics: cached subtree results live longer than listings since they cost a
+# full recursive listing; writes through the app still invalidate the affected subtrees
+stats_cache_ttl = 600
+stats_cache_size = 10000
+stats_cache = ListingCache(ttl=stats_cache_ttl, max_entries=stats_cache_size)
+stats_workers = prefix_stats.DEFAULT_WORKERS
+stats_split_depth = prefix_stats.DEFAULT_SPLIT_DEPTH
+
+# Chunk size used when streaming downloads to the client
+download_chunk_size = 1024 * 1024
+
+# Objects up to this size are editable inline; larger text objects are shown in read-only windows
+editor_max_inline = 1024 * 1024
+editor_window_size = 64 * 1024
+# Bytes sniffed from the start of an object to decide whether it is text
+binary_sniff_size = 8192
+
+# Uploads at or above this size go through multipart with parallel parts
+multipart_threshold = s3_transfer.MULTIPART_THRESHOLD
+upload_part_size = s3_transfer.PART_SIZE
+upload_workers = s3_transfer.DEFAULT_WORKERS
+# Let the browser upload parts straight to S3 with presigned URLs
+direct_upload = False
+
+# Background jobs (load generation) started from the UI
+jobs = JobRegistry()
+
+# Log requests slower than this many seconds with their S3 call breakdown (None to disable)
+slow_request_threshold = 1.0
 
 app = Flask(__name__)
 app.secret_key = 'supersecretkey'
 
-def list_files_in_folder(prefix):
+# Per-route and per-S3-operation metrics, served at /metrics
+registry = metrics.MetricsRegistry()
+metrics.instrument_client(s3, registry)
+metrics.instrument_app(app, registry, slow_request_threshold)
+
+def list_files_in_folder(prefix, limit=page_size, start_after=''):
+    cache_key = (bucket_name, prefix, start_after, limit)
+    cached = listing_cache.get(cache_key)
+    if cached is not MISSING:
+        return cached
     try:
-        response = s3.list_objects_v2(
-            Bucket=bucket_name,
-            Prefix=prefix,
-            Delimiter='/'
-        )
-        folders = []
-        files = []
-        if 'CommonPrefixes' in response:
-            folders = [cp['Prefix'] for cp in response['CommonPrefixes']]
-        if 'Contents' in response:
-            files = [obj['Key'] for obj in response['Contents'] if obj['Key'] != prefix]
-        return folders, files
+        # Walk the prefix page by page (ContinuationToken under the hood) until the index page is full
+        listing = web_helpers.FolderListing(prefix, start_after, limit)
+        paginator = s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(**listing.list_params(bucket_name)):
+            if listing.add(page):
+                break
+        result = listing.result()
+        listing_cache.put(cache_key, result)
+        return result
     except Exception as e:
         flash(f'Error listing files: {e}', 'danger')
-        return [], []
+        return [], [], None
+
+def invalidate_caches(key, recursive=False):
+    listing_cache.invalidate_key(bucket_name, key, recursive)
+    stats_cache.invalidate_key(bucket_name, key, recursive)
 
-def generate_random_string(length=10):
-    return ''.join(random.choices(string.ascii_letters + string.digits, k=length))
+def get_folder_stats(prefix):
+    stats = stats_cache.get((bucket_name, prefix, 'summary'))
+    return None if stats is MISSING else stats
 
-def generate_jibberish_content():
-    return ''.join(random.choices(string.ascii_letters + string.digits + string.punctuation + ' ', k=100))
+def get_page_size():
+    return parse_page_size(request.args.get('page_size', page_size), page_size, max_page_size)
 
-def get_breadcrumbs(prefix):
-    if not prefix:
-        return []
-    parts = prefix.strip('/').split('/')
-    breadcrumbs = [{'name': 'Home', 'prefix': ''}]
-    for i, part in enumerate(parts):
-        breadcrumbs.append({'name': part, 'prefix': '/'.join(parts[:i + 1]) + '/'})
-    return breadcrumbs
+def report_delete_progress(result):
+    app.logger.info(f'Bulk delete progress: {result.succeeded} deleted, {result.failed} failed')
+
+def flash_delete_result(result):
+    flash(f'Deleted {result.succeeded} objects.', 'success')
+    if result.errors:
+        sample = ', '.join(f"{err['Key']} ({err['Code']})" for err in result.errors[:5])
+        flash(f'Failed to delete {result.failed} objects: {sample}', 'danger')
+
+def read_range(key, start, end):
+    response = s3.get_object(Bucket=bucket_name, Key=key, Range=f'bytes={start}-{end}')
+    return response['Body'].read()
 
 @app.route('/')
 @app.route('/<path:prefix>')
 def index(prefix=''):
     if prefix and not prefix.endswith('/'):
         prefix += '/'
-    folders, files = list_files_in_folder(prefix)
+    limit = get_page_size()
+    after = request.args.get('after', '')
+    # Cursors of the pages before this one, so "Previous" can walk back
+    back = request.args.getlist('back')
+    page_number = web_helpers.parse_page_number(request.args.get('page', len(back) + 1))
+    folders, files, next_cursor = list_files_in_folder(prefix, limit, after)
     breadcrumbs = get_breadcrumbs(prefix)
-    return render_template('index.html', folders=folders, files=files, prefix=prefix, breadcrumbs=breadcrumbs, bucket_name=bucket_name)
+    links = web_helpers.page_links(url_for, prefix, limit, after, back, page_number, next_cursor)
+    return render_template('index.html', folders=folders, files=files, prefix=prefix, breadcrumbs=breadcrumbs, bucket_name=bucket_name,
+                           direct_upload=direct_upload, folder_stats=get_folder_stats(prefix), **links)
 
 @app.route('/create_folder', methods=['POST'])
 def create_folder():
@@ -82,6 +137,7 @@ def create_folder():
         flash('Folder created successfully.', 'success')
     except Exception as e:
         flash(f'Error creating folder: {e}', 'danger')
+    invalidate_caches(new_folder)
     return redirect(url_for('index', prefix=prefix))
 
 @app.route('/upload_file', methods=['POST'])
@@ -92,12 +148,47 @@ def upload_file():
         prefix += '/'
     file_key = f'{prefix}{file.filename}'
     try:
-        s3.put_object(Bucket=bucket_name, Key=file_key, Body=file)
+        s3_transfer.upload_stream(s3, bucket_name, file_key, file.stream, size=file.content_length or None,
+                                  threshold=multipart_threshold, part_size=upload_part_size, workers=upload_workers)
         flash('File uploaded successfully.', 'success')
     except Exception as e:
         flash(f'Error uploading file: {e}', 'danger')
+    invalidate_caches(file_key)
     return redirect(url_for('index', prefix=prefix))
 
+@app.route('/presign_upload', methods=['POST'])
+def presign_upload():
+    data = request.get_json()
+    prefix = data.get('prefix', '')
+    if prefix and not prefix.endswith('/'):
+        prefix += '/'
+    file_key = f"{prefix}{data['filename']}"
+    try:
+        upload = s3_transfer.presign_multipart_upload(s3, bucket_name, file_key, int(data['size']), upload_part_size)
+        return jsonify(upload)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/complete_upload', methods=['POST'])
+def complete_upload():
+    data = request.get_json()
+    try:
+        s3_transfer.complete_presigned_upload(s3, bucket_name, data['key'], data['upload_id'], data['parts'])
+        invalidate_caches(data['key'])
+        flash('File uploaded successfully.', 'success')
+        return jsonify({'key': data['key']})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/abort_upload', methods=['POST'])
+def abort_upload():
+    data = request.get_json()
+    try:
+        s3.abort_multipart_upload(Bucket=bucket_name, Key=data['key'], UploadId=data['upload_id'])
+        return jsonify({'key': data['key']})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/create_file', methods=['POST'])
 def create_file():
     file_name = request.form['file_name']
@@ -111,81 +202,241 @@ def create_file():
         flash('File created successfully.', 'success')
     except Exception as e:
         flash(f'Error creating file: {e}', 'danger')
+    invalidate_caches(file_key)
     return redirect(url_for('index', prefix=prefix))
 
 @app.route('/edit_file/<path:key>', methods=['GET', 'POST'])
 def edit_file(key):
     if request.method == 'POST':
         new_content = request.form['file_content']
+        etag = request.form.get('etag')
+        params = {'Bucket': bucket_name, 'Key': key, 'Body': new_content}
+        # Only write if nobody changed the object since it was opened, unless the user chose to overwrite
+        if etag and not request.form.get('force'):
+            params['IfMatch'] = etag
         try:
-            s3.put_object(Bucket=bucket_name, Key=key, Body=new_content)
+            s3.put_object(**params)
             flash('File updated successfully.', 'success')
         except Exception as e:
-            flash(f'Error updating file: {e}', 'danger')
-        return redirect(url_for('index', prefix='/'.join(key.split('/')[:-1])))
+            message, conflict = web_helpers.save_error(e)
+            flash(message, 'danger')
+            # Show the editor again with the user's text so a failed save loses nothing
+            view = web_helpers.empty_edit_view(key)
+            view.update(content=new_content, etag=etag, editable=True, conflict=conflict)
+            return render_template('edit.html', **view)
+        invalidate_caches(key)
+        return redirect(url_for('index', prefix=web_helpers.parent_prefix(key)))
     else:
+        offset = web_helpers.parse_offset(request.args.get('offset', 0))
+        view = web_helpers.empty_edit_view(key)
         try:
-            response = s3.get_object(Bucket=bucket_name, Key=key)
-            content = response['Body'].read().decode('utf-8')
+            head = s3.head_object(Bucket=bucket_name, Key=key)
+            start, end = web_helpers.edit_window(head['ContentLength'], offset, editor_max_inline, editor_window_size)
+            if end is None:
+                # Pin the read to the ETag we will save against
+                data = s3.get_object(Bucket=bucket_name, Key=key, IfMatch=head['ETag'])['Body'].read()
+            else:
+                data = read_range(key, start, end)
+            sample = data[:binary_sniff_size] if start == 0 else read_range(key, 0, binary_sniff_size - 1)
+            view, messages = web_helpers.build_edit_view(key, head, data, start, end, sample, editor_window_size)
+            for message, category in messages:
+                flash(message, category)
         except Exception as e:
             flash(f'Error reading file: {e}', 'danger')
-            content = ''
-        return render_template('edit.html', key=key, content=content)
+        return render_template('edit.html', **view)
 
 @app.route('/delete/<path:key>')
 def delete_file_or_folder(key):
     try:
         # Check if it's a folder
         if key.endswith('/'):
-            # List all objects with this prefix and delete them
-            response = s3.list_objects_v2(Bucket=bucket_name, Prefix=key)
-            if 'Contents' in response:
-                for obj in response['Contents']:
-                    s3.delete_object(Bucket=bucket_name, Key=obj['Key'])
+            # Delete every object under this prefix in batches
+            result = s3_bulk.delete_prefix(s3, bucket_name, key, progress=report_delete_progress)
+            flash_delete_result(result)
         else:
             # It's a file, delete it
             s3.delete_object(Bucket=bucket_name, Key=key)
-        flash('Deleted successfully.', 'success')
+            flash('Deleted successfully.', 'success')
     except Exception as e:
         flash(f'Error deleting: {e}', 'danger')
-    return redirect(url_for('index', prefix='/'.join(key.split('/')[:-1])))
+    invalidate_caches(key, recursive=key.endswith('/'))
+    return redirect(url_for('index', prefix=web_helpers.parent_prefix(key)))
+
+@app.route('/cache_stats')
+def cache_stats():
+    return jsonify(listing_cache.stats())
+
+@app.route('/metrics')
+def metrics_endpoint():
+    cache = listing_cache.stats()
+    gauges = {f'listing_cache_{name}': cache[name] for name in ('entries', 'hits', 'misses', 'evictions', 'invalidations')}
+    stats = stats_cache.stats()
+    gauges.update({f'stats_cache_{name}': stats[name] for name in ('entries', 'hits', 'misses', 'evictions', 'invalidations')})
+    return Response(registry.render(gauges), mimetype='text/plain; version=0.0.4')
 
 @app.route('/download/<path:key>')
 def download_file(key):
+    params = web_helpers.download_params(bucket_name, key, request.headers)
+    # HEAD (sent by download managers before resuming) never reads a body, so don't open one
+    fetch = s3.head_object if request.method == 'HEAD' else s3.get_object
     try:
-        local_path = os.path.join(os.getcwd(), os.path.basename(key))
-        s3.download_file(bucket_name, key, local_path)
-        return send_file(local_path, as_attachment=True, download_name=os.path.basename(key))
+        try:
+            response = fetch(**params)
+        except ClientError as e:
+            if not web_helpers.range_validator_failed(e.response.get('Error', {}), params):
+                raise
+            # The object changed since the client's partial download: send all of it
+            response = fetch(**web_helpers.full_download_params(params))
+    except ClientError as e:
+        answer = web_helpers.download_error_response(e.response.get('Error', {}), request.headers)
+        if answer:
+            status, headers = answer
+            return Response(status=status, headers=headers)
+        flash(f'Error downloading file: {e}', 'danger')
+        return redirect(url_for('index', prefix=web_helpers.parent_prefix(key)))
     except Exception as e:
         flash(f'Error downloading file: {e}', 'danger')
-        return redirect(url_for('index', prefix='/'.join(key.split('/')[:-1])))
+        return redirect(url_for('index', prefix=web_helpers.parent_prefix(key)))
+
+    status, headers = web_helpers.download_headers(key, response)
+    mimetype = response.get('ContentType') or 'application/octet-stream'
+    if 'Body' not in response:
+        head_response = Response(status=status, headers=headers, mimetype=mimetype)
+        head_response.headers['Content-Length'] = headers['Content-Length']
+        return head_response
+
+    body = response['Body']
+
+    def generate():
+        try:
+            for chunk in body.iter_chunks(download_chunk_size):
+                yield chunk
+        finally:
+            body.close()
+
+    return Response(generate(), status=status, headers=headers, mimetype=mimetype)
 
 @app.route('/generate_jibberish', methods=['POST'])
 def generate_jibberish():
     prefix = request.form['prefix']
     if prefix and not prefix.endswith('/'):
         prefix += '/'
-    
-    for _ in range(5):  # Create 5 jibberish folders
-        folder_name = generate_random_string()
-        new_folder = f'{prefix}{folder_name}/'
+
+    try:
+        spec = loadgen.LoadSpec(
+            count=int(request.form.get('count', 10)),
+            size=request.form.get('size', '100'),
+            size_dist=request.form.get('size_dist', 'fixed'),
+            max_size=request.form.get('max_size') or None,
+            fanout=int(request.form.get('fanout', 5)),
+            depth=int(request.form.get('depth', 1)),
+            # Stay within the shared client's connection pool
+            concurrency=min(int(request.form.get('concurrency', 8)), settings['max_pool_connections'])
+        )
+    except ValueError as e:
+        flash(f'Invalid load generation settings: {e}', 'danger')
+        return redirect(url_for('index', prefix=prefix))
+
+    def run(job):
         try:
-            s3.put_object(Bucket=bucket_name, Key=new_folder)
-        except Exception as e:
-            flash(f'Error creating folder: {e}', 'danger')
-    
-    for _ in range(5):  # Create 5 jibberish files
-        file_name = generate_random_string() + '.txt'
-        file_content = generate_jibberish_content()
-        file_key = f'{prefix}{file_name}'
+            return loadgen.run_load(s3, bucket_name, prefix, spec, job)
+        finally:
+            invalidate_caches(prefix, recursive=True)
+
+    job = jobs.submit('loadgen', run, description=f'{spec.count} objects under /{prefix}')
+    flash(f'Load generation job {job.id} started. Status: {url_for("job_status", job_id=job.id)}', 'success')
+    return redirect(url_for('index', prefix=prefix))
+
+@app.route('/transfer', methods=['POST'])
+def transfer():
+    prefix = request.form['prefix']
+    if prefix and not prefix.endswith('/'):
+        prefix += '/'
+    operation = request.form.get('operation', 'copy')
+    try:
+        source, destination, is_folder = web_helpers.resolve_transfer(prefix, operation, request.form['source'], request.form['destination'])
+    except ValueError as e:
+        flash(f'Error starting {operation}: {e}', 'danger')
+        return redirect(url_for('index', prefix=prefix))
+
+    def run(job):
+        def progress(result):
+            if result.total % 100 == 0:
+                job.progress = {'phase': 'copy', 'copied': result.succeeded, 'failed': result.failed}
         try:
-            s3.put_object(Bucket=bucket_name, Key=file_key, Body=file_content)
-        except Exception as e:
-            flash(f'Error creating file: {e}', 'danger')
-    
-    flash('Random jibberish files and folders created successfully.', 'success')
+            if not is_folder:
+                head = s3.head_object(Bucket=bucket_name, Key=source)
+                # CopyObject resets the storage class; head_object omits it for STANDARD objects
+                extra = {'StorageClass': head['StorageClass']} if head.get('StorageClass', 'STANDARD') != 'STANDARD' else {}
+                s3_transfer.copy_object(s3, bucket_name, source, destination, head['ContentLength'], **extra)
+                if operation == 'move':
+                    s3.delete_object(Bucket=bucket_name, Key=source)
+                return {'copied': 1, 'failed': 0, 'deleted': 1 if operation == 'move' else 0}
+            if operation == 'move':
+                copy_result, delete_result = s3_bulk.move_prefix(s3, bucket_name, source, destination, copy_workers, progress)
+            else:
+                copy_result = s3_bulk.copy_prefix(s3, bucket_name, source, destination, copy_workers, progress)
+                delete_result = None
+            summary = web_helpers.transfer_summary(copy_result, delete_result)
+            job.progress = summary
+            return summary
+        finally:
+            invalidate_caches(destination, recursive=is_folder)
+            if operation == 'move':
+                invalidate_caches(source, recursive=is_folder)
+
+    job = jobs.submit(operation, run, description=f'{operation.capitalize()} /{source} to /{destination}')
+    flash(f'{operation.capitalize()} job {job.id} started. Status: {url_for("job_status", job_id=job.id)}', 'success')
+    return redirect(url_for('index', prefix=prefix))
+
+@app.route('/folder_stats', methods=['POST'])
+def start_folder_stats():
+    prefix = request.form['prefix']
+    if prefix and not prefix.endswith('/'):
+        prefix += '/'
+    inventory_manifest = request.form.get('inventory_manifest', '').strip()
+    if request.form.get('refresh'):
+        # Forget every cached subtree so the whole prefix is listed again
+        stats_cache.invalidate_prefix(bucket_name, prefix, recursive=True)
+
+    def run(job):
+        def progress(update):
+            job.progress = update
+        if inventory_manifest:
+            stats = prefix_stats.load_inventory_stats(s3, inventory_manifest, prefix, bucket_name,
+                                                      stats_workers, progress)
+        else:
+            stats = prefix_stats.compute_stats(s3, bucket_name, prefix, stats_cache,
+                                               stats_workers, stats_split_depth, progress)
+        stats_cache.put((bucket_name, prefix, 'summary'), stats)
+        return stats
+
+    source = 'inventory' if inventory_manifest else 'live listing'
+    job = jobs.submit('folder_stats', run, description=f'Folder stats for /{prefix} ({source})')
+    flash(f'Folder stats job {job.id} started. Status: {url_for("job_status", job_id=job.id)}', 'success')
     return redirect(url_for('index', prefix=prefix))
 
+@app.route('/folder_stats')
+def folder_stats():
+    prefix = request.args.get('prefix', '')
+    if prefix and not prefix.endswith('/'):
+        prefix += '/'
+    stats = get_folder_stats(prefix)
+    if stats is None:
+        return jsonify({'error': f'No folder stats computed for /{prefix}'}), 404
+    return jsonify(stats)
+
+@app.route('/jobs')
+def list_jobs():
+    return jsonify([job.to_dict() for job in jobs.list()])
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Unknown job: {job_id}'}), 404
+    return jsonify(job.to_dict())
+
 @app.route('/cleanup', methods=['POST'])
 def cleanup():
     prefix = request.form['prefix']
@@ -193,13 +444,11 @@ def cleanup():
         prefix += '/'
     
     try:
-        response = s3.list_objects_v2(Bucket=bucket_name, Prefix=prefix)
-        if 'Contents' in response:
-            for obj in response['Contents']:
-                s3.delete_object(Bucket=bucket_name, Key=obj['Key'])
-        flash('Cleanup successful.', 'success')
+        result = s3_bulk.delete_prefix(s3, bucket_name, prefix, progress=report_delete_progress)
+        flash_delete_result(result)
     except Exception as e:
         flash(f'Error during cleanup: {e}', 'danger')
+    invalidate_caches(prefix, recursive=True)
     
     return redirect(url_for('index', prefix=prefix))
 
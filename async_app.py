@@ -0,0 +1,482 @@
+from quart import Quart, render_template, request, redirect, url_for, flash, Response, jsonify
+from botocore.exceptions import ClientError
+import asyncio
+import contextlib
+import s3_client
+import s3_async
+import s3_transfer
+import loadgen
+import prefix_stats
+import web_helpers
+from web_helpers import parse_page_size, get_breadcrumbs
+from jobs import JobRegistry
+import metrics
+from listing_cache import ListingCache, MISSING
+
+"""
+Async S3 Browser (ASGI)
+=======================
+
+The browser app of app.py served by Quart on an ASGI server, with every S3 call
+made through one shared aiobotocore client. Routes, endpoint names and
+templates are the same as app.py; a request waiting on S3 only holds a
+coroutine, so one process serves many concurrent users. Folder deletes,
+cleanup, copies/moves, folder stats and load generation fan out through
+s3_async with bounded asyncio concurrency, and long operations run as asyncio
+tasks tracked by the same /jobs endpoints.
+
+Requires quart and aiobotocore (plus an ASGI server such as hypercorn). S3
+Inventory ingestion still parses files on a thread with the boto3 client, and
+the slow-request log has no template render time here.
+
+Example Commands:
+-----------------
+1. Serve on port 5001 with hypercorn:
+   hypercorn async_app:app --bind 127.0.0.1:5001
+
+2. Development server:
+   python async_app.py
+"""
+
+# Shared bucket; the aiobotocore client is opened when the server starts (see s3_client.py for the settings)
+settings = s3_client.load_settings()
+bucket_name = settings['bucket_name']
+s3 = None
+client_stack = contextlib.AsyncExitStack()
+
+# Listing page size (entries per page in the index view)
+page_size = 1000
+max_page_size = 5000
+
+# Cached listings expire after this many seconds; at most this many pages are kept
+listing_cache_ttl = 30
+listing_cache_size = 1024
+listing_cache = ListingCache(ttl=listing_cache_ttl, max_entries=listing_cache_size)
+
+# Concurrent S3 requests per fan-out operation (delete batches, copies, listings)
+fanout_concurrency = 16
+
+# Folder statistics: cached subtree results live longer than listings since they cost a
+# full recursive listing; writes through the app still invalidate the affected subtrees
+stats_cache_ttl = 600
+stats_cache_size = 10000
+stats_cache = ListingCache(ttl=stats_cache_ttl, max_entries=stats_cache_size)
+stats_split_depth = prefix_stats.DEFAULT_SPLIT_DEPTH
+
+# Chunk size used when streaming downloads to the client
+download_chunk_size = 1024 * 1024
+
+# Objects up to this size are editable inline; larger text objects are shown in read-only windows
+editor_max_inline = 1024 * 1024
+editor_window_size = 64 * 1024
+# Bytes sniffed from the start of an object to decide whether it is text
+binary_sniff_size = 8192
+
+# Uploads at or above this size go through multipart with parallel parts
+multipart_threshold = s3_transfer.MULTIPART_THRESHOLD
+upload_part_size = s3_transfer.PART_SIZE
+upload_workers = s3_transfer.DEFAULT_WORKERS
+# Let the browser upload parts straight to S3 with presigned URLs
+direct_upload = False
+
+# Background jobs started from the UI, run as asyncio tasks
+jobs = JobRegistry()
+
+# Log requests slower than this many seconds with their S3 call breakdown (None to disable)
+slow_request_threshold = 1.0
+
+app = Quart(__name__)
+app.secret_key = 'supersecretkey'
+# Large uploads and downloads stream for as long as they take
+app.config.update(MAX_CONTENT_LENGTH=None, BODY_TIMEOUT=None, RESPONSE_TIMEOUT=None)
+
+# Per-route and per-S3-operation metrics, served at /metrics
+registry = metrics.MetricsRegistry()
+metrics.instrument_asgi_app(app, registry, slow_request_threshold)
+
+@app.before_serving
+async def open_client():
+    global s3
+    s3 = await client_stack.enter_async_context(s3_client.create_async_client(settings))
+    metrics.instrument_client(s3, registry, metrics.asgi_request_calls)
+
+@app.after_serving
+async def close_client():
+    await client_stack.aclose()
+
+async def list_files_in_folder(prefix, limit=page_size, start_after=''):
+    cache_key = (bucket_name, prefix, start_after, limit)
+    cached = listing_cache.get(cache_key)
+    if cached is not MISSING:
+        return cached
+    try:
+        listing = web_helpers.FolderListing(prefix, start_after, limit)
+        paginator = s3.get_paginator('list_objects_v2')
+        # Stop the paginator when the page is full instead of leaving it to the garbage collector
+        async with contextlib.aclosing(aiter(paginator.paginate(**listing.list_params(bucket_name)))) as pages:
+            async for page in pages:
+                if listing.add(page):
+                    break
+        result = listing.result()
+        listing_cache.put(cache_key, result)
+        return result
+    except Exception as e:
+        await flash(f'Error listing files: {e}', 'danger')
+        return [], [], None
+
+def invalidate_caches(key, recursive=False):
+    listing_cache.invalidate_key(bucket_name, key, recursive)
+    stats_cache.invalidate_key(bucket_name, key, recursive)
+
+def get_folder_stats(prefix):
+    stats = stats_cache.get((bucket_name, prefix, 'summary'))
+    return None if stats is MISSING else stats
+
+def normalize_prefix(prefix):
+    if prefix and not prefix.endswith('/'):
+        prefix += '/'
+    return prefix
+
+def report_delete_progress(result):
+    app.logger.info(f'Bulk delete progress: {result.succeeded} deleted, {result.failed} failed')
+
+async def flash_delete_result(result):
+    await flash(f'Deleted {result.succeeded} objects.', 'success')
+    if result.errors:
+        sample = ', '.join(f"{err['Key']} ({err['Code']})" for err in result.errors[:5])
+        await flash(f'Failed to delete {result.failed} objects: {sample}', 'danger')
+
+async def read_range(key, start, end):
+    response = await s3.get_object(Bucket=bucket_name, Key=key, Range=f'bytes={start}-{end}')
+    async with response['Body'] as body:
+        return await body.read()
+
+@app.route('/')
+@app.route('/<path:prefix>')
+async def index(prefix=''):
+    prefix = normalize_prefix(prefix)
+    limit = parse_page_size(request.args.get('page_size', page_size), page_size, max_page_size)
+    after = request.args.get('after', '')
+    # Cursors of the pages before this one, so "Previous" can walk back
+    back = request.args.getlist('back')
+    page_number = web_helpers.parse_page_number(request.args.get('page', len(back) + 1))
+    folders, files, next_cursor = await list_files_in_folder(prefix, limit, after)
+    breadcrumbs = get_breadcrumbs(prefix)
+    links = web_helpers.page_links(url_for, prefix, limit, after, back, page_number, next_cursor)
+    return await render_template('index.html', folders=folders, files=files, prefix=prefix, breadcrumbs=breadcrumbs, bucket_name=bucket_name,
+                                 direct_upload=direct_upload, folder_stats=get_folder_stats(prefix), **links)
+
+@app.route('/create_folder', methods=['POST'])
+async def create_folder():
+    form = await request.form
+    prefix = normalize_prefix(form['prefix'])
+    new_folder = f"{prefix}{form['folder_name']}/"
+    try:
+        await s3.put_object(Bucket=bucket_name, Key=new_folder)
+        await flash('Folder created successfully.', 'success')
+    except Exception as e:
+        await flash(f'Error creating folder: {e}', 'danger')
+    invalidate_caches(new_folder)
+    return redirect(url_for('index', prefix=prefix))
+
+@app.route('/upload_file', methods=['POST'])
+async def upload_file():
+    form = await request.form
+    file = (await request.files)['file']
+    prefix = normalize_prefix(form['prefix'])
+    file_key = f'{prefix}{file.filename}'
+    try:
+        await s3_async.upload_stream(s3, bucket_name, file_key, file.stream, size=file.content_length or None,
+                                     threshold=multipart_threshold, part_size=upload_part_size, concurrency=upload_workers)
+        await flash('File uploaded successfully.', 'success')
+    except Exception as e:
+        await flash(f'Error uploading file: {e}', 'danger')
+    invalidate_caches(file_key)
+    return redirect(url_for('index', prefix=prefix))
+
+@app.route('/presign_upload', methods=['POST'])
+async def presign_upload():
+    data = await request.get_json()
+    prefix = normalize_prefix(data.get('prefix', ''))
+    file_key = f"{prefix}{data['filename']}"
+    try:
+        upload = await s3_async.presign_multipart_upload(s3, bucket_name, file_key, int(data['size']), upload_part_size)
+        return jsonify(upload)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/complete_upload', methods=['POST'])
+async def complete_upload():
+    data = await request.get_json()
+    try:
+        await s3_async.complete_presigned_upload(s3, bucket_name, data['key'], data['upload_id'], data['parts'])
+        invalidate_caches(data['key'])
+        await flash('File uploaded successfully.', 'success')
+        return jsonify({'key': data['key']})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/abort_upload', methods=['POST'])
+async def abort_upload():
+    data = await request.get_json()
+    try:
+        await s3.abort_multipart_upload(Bucket=bucket_name, Key=data['key'], UploadId=data['upload_id'])
+        return jsonify({'key': data['key']})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/create_file', methods=['POST'])
+async def create_file():
+    form = await request.form
+    prefix = normalize_prefix(form['prefix'])
+    file_key = f"{prefix}{form['file_name']}"
+    try:
+        await s3.put_object(Bucket=bucket_name, Key=file_key, Body=form['file_content'])
+        await flash('File created successfully.', 'success')
+    except Exception as e:
+        await flash(f'Error creating file: {e}', 'danger')
+    invalidate_caches(file_key)
+    return redirect(url_for('index', prefix=prefix))
+
+@app.route('/edit_file/<path:key>', methods=['GET', 'POST'])
+async def edit_file(key):
+    if request.method == 'POST':
+        form = await request.form
+        new_content = form['file_content']
+        etag = form.get('etag')
+        params = {'Bucket': bucket_name, 'Key': key, 'Body': new_content}
+        # Only write if nobody changed the object since it was opened, unless the user chose to overwrite
+        if etag and not form.get('force'):
+            params['IfMatch'] = etag
+        try:
+            await s3.put_object(**params)
+            await flash('File updated successfully.', 'success')
+        except Exception as e:
+            message, conflict = web_helpers.save_error(e)
+            await flash(message, 'danger')
+            # Show the editor again with the user's text so a failed save loses nothing
+            view = web_helpers.empty_edit_view(key)
+            view.update(content=new_content, etag=etag, editable=True, conflict=conflict)
+            return await render_template('edit.html', **view)
+        invalidate_caches(key)
+        return redirect(url_for('index', prefix=web_helpers.parent_prefix(key)))
+    offset = web_helpers.parse_offset(request.args.get('offset', 0))
+    view = web_helpers.empty_edit_view(key)
+    try:
+        head = await s3.head_object(Bucket=bucket_name, Key=key)
+        start, end = web_helpers.edit_window(head['ContentLength'], offset, editor_max_inline, editor_window_size)
+        if end is None:
+            # Pin the read to the ETag we will save against
+            response = await s3.get_object(Bucket=bucket_name, Key=key, IfMatch=head['ETag'])
+            async with response['Body'] as body:
+                data = await body.read()
+        else:
+            data = await read_range(key, start, end)
+        sample = data[:binary_sniff_size] if start == 0 else await read_range(key, 0, binary_sniff_size - 1)
+        view, messages = web_helpers.build_edit_view(key, head, data, start, end, sample, editor_window_size)
+        for message, category in messages:
+            await flash(message, category)
+    except Exception as e:
+        await flash(f'Error reading file: {e}', 'danger')
+    return await render_template('edit.html', **view)
+
+@app.route('/delete/<path:key>')
+async def delete_file_or_folder(key):
+    try:
+        if key.endswith('/'):
+            # Delete every object under this prefix in concurrent batches
+            result = await s3_async.delete_prefix(s3, bucket_name, key, fanout_concurrency, report_delete_progress)
+            await flash_delete_result(result)
+        else:
+            await s3.delete_object(Bucket=bucket_name, Key=key)
+            await flash('Deleted successfully.', 'success')
+    except Exception as e:
+        await flash(f'Error deleting: {e}', 'danger')
+    invalidate_caches(key, recursive=key.endswith('/'))
+    return redirect(url_for('index', prefix=web_helpers.parent_prefix(key)))
+
+@app.route('/cache_stats')
+async def cache_stats():
+    return jsonify(listing_cache.stats())
+
+@app.route('/metrics')
+async def metrics_endpoint():
+    cache = listing_cache.stats()
+    gauges = {f'listing_cache_{name}': cache[name] for name in ('entries', 'hits', 'misses', 'evictions', 'invalidations')}
+    stats = stats_cache.stats()
+    gauges.update({f'stats_cache_{name}': stats[name] for name in ('entries', 'hits', 'misses', 'evictions', 'invalidations')})
+    gauges['asyncio_tasks'] = len(asyncio.all_tasks())
+    return Response(registry.render(gauges), mimetype='text/plain; version=0.0.4')
+
+@app.route('/download/<path:key>')
+async def download_file(key):
+    params = web_helpers.download_params(bucket_name, key, request.headers)
+    # HEAD (sent by download managers before resuming) never reads a body, so don't open one
+    fetch = s3.head_object if request.method == 'HEAD' else s3.get_object
+    try:
+        try:
+            response = await fetch(**params)
+        except ClientError as e:
+            if not web_helpers.range_validator_failed(e.response.get('Error', {}), params):
+                raise
+            # The object changed since the client's partial download: send all of it
+            response = await fetch(**web_helpers.full_download_params(params))
+    except ClientError as e:
+        answer = web_helpers.download_error_response(e.response.get('Error', {}), request.headers)
+        if answer:
+            status, headers = answer
+            return Response('', status=status, headers=headers)
+        await flash(f'Error downloading file: {e}', 'danger')
+        return redirect(url_for('index', prefix=web_helpers.parent_prefix(key)))
+    except Exception as e:
+        await flash(f'Error downloading file: {e}', 'danger')
+        return redirect(url_for('index', prefix=web_helpers.parent_prefix(key)))
+
+    status, headers = web_helpers.download_headers(key, response)
+    mimetype = response.get('ContentType') or 'application/octet-stream'
+    if 'Body' not in response:
+        head_response = Response('', status=status, headers=headers, mimetype=mimetype)
+        head_response.headers['Content-Length'] = headers['Content-Length']
+        return head_response
+
+    body = response['Body']
+
+    async def generate():
+        try:
+            async for chunk in body.iter_chunks(download_chunk_size):
+                yield chunk
+        finally:
+            body.close()
+
+    return Response(generate(), status=status, headers=headers, mimetype=mimetype)
+
+@app.route('/generate_jibberish', methods=['POST'])
+async def generate_jibberish():
+    form = await request.form
+    prefix = normalize_prefix(form['prefix'])
+    try:
+        spec = loadgen.LoadSpec(
+            count=int(form.get('count', 10)),
+            size=form.get('size', '100'),
+            size_dist=form.get('size_dist', 'fixed'),
+            max_size=form.get('max_size') or None,
+            fanout=int(form.get('fanout', 5)),
+            depth=int(form.get('depth', 1)),
+            # Stay within the shared client's connection pool
+            concurrency=min(int(form.get('concurrency', 8)), settings['max_pool_connections'])
+        )
+    except ValueError as e:
+        await flash(f'Invalid load generation settings: {e}', 'danger')
+        return redirect(url_for('index', prefix=prefix))
+
+    async def run(job):
+        try:
+            return await s3_async.run_load(s3, bucket_name, prefix, spec, job)
+        finally:
+            invalidate_caches(prefix, recursive=True)
+
+    job = jobs.submit_task('loadgen', run, description=f'{spec.count} objects under /{prefix}')
+    await flash(f'Load generation job {job.id} started. Status: {url_for("job_status", job_id=job.id)}', 'success')
+    return redirect(url_for('index', prefix=prefix))
+
+@app.route('/transfer', methods=['POST'])
+async def transfer():
+    form = await request.form
+    prefix = normalize_prefix(form['prefix'])
+    operation = form.get('operation', 'copy')
+    try:
+        source, destination, is_folder = web_helpers.resolve_transfer(prefix, operation, form['source'], form['destination'])
+    except ValueError as e:
+        await flash(f'Error starting {operation}: {e}', 'danger')
+        return redirect(url_for('index', prefix=prefix))
+
+    async def run(job):
+        def progress(result):
+            if result.total % 100 == 0:
+                job.progress = {'phase': 'copy', 'copied': result.succeeded, 'failed': result.failed}
+        try:
+            if not is_folder:
+                head = await s3.head_object(Bucket=bucket_name, Key=source)
+                # CopyObject resets the storage class; head_object omits it for STANDARD objects
+                extra = {'StorageClass': head['StorageClass']} if head.get('StorageClass', 'STANDARD') != 'STANDARD' else {}
+                await s3_async.copy_object(s3, bucket_name, source, destination, head['ContentLength'], **extra)
+                if operation == 'move':
+                    await s3.delete_object(Bucket=bucket_name, Key=source)
+                return {'copied': 1, 'failed': 0, 'deleted': 1 if operation == 'move' else 0}
+            if operation == 'move':
+                copy_result, delete_result = await s3_async.move_prefix(s3, bucket_name, source, destination, fanout_concurrency, progress)
+            else:
+                copy_result = await s3_async.copy_prefix(s3, bucket_name, source, destination, fanout_concurrency, progress)
+                delete_result = None
+            summary = web_helpers.transfer_summary(copy_result, delete_result)
+            job.progress = summary
+            return summary
+        finally:
+            invalidate_caches(destination, recursive=is_folder)
+            if operation == 'move':
+                invalidate_caches(source, recursive=is_folder)
+
+    job = jobs.submit_task(operation, run, description=f'{operation.capitalize()} /{source} to /{destination}')
+    await flash(f'{operation.capitalize()} job {job.id} started. Status: {url_for("job_status", job_id=job.id)}', 'success')
+    return redirect(url_for('index', prefix=prefix))
+
+@app.route('/folder_stats', methods=['POST'])
+async def start_folder_stats():
+    form = await request.form
+    prefix = normalize_prefix(form['prefix'])
+    inventory_manifest = form.get('inventory_manifest', '').strip()
+    if form.get('refresh'):
+        # Forget every cached subtree so the whole prefix is listed again
+        stats_cache.invalidate_prefix(bucket_name, prefix, recursive=True)
+
+    async def run(job):
+        def progress(update):
+            job.progress = update
+        if inventory_manifest:
+            # Inventory files are parsed with the blocking client on a worker thread
+            stats = await asyncio.to_thread(prefix_stats.load_inventory_stats, s3_client.get_client(), inventory_manifest,
+                                            prefix, bucket_name, fanout_concurrency, progress)
+        else:
+            stats = await s3_async.compute_stats(s3, bucket_name, prefix, stats_cache,
+                                                 fanout_concurrency, stats_split_depth, progress)
+        stats_cache.put((bucket_name, prefix, 'summary'), stats)
+        return stats
+
+    source = 'inventory' if inventory_manifest else 'live listing'
+    job = jobs.submit_task('folder_stats', run, description=f'Folder stats for /{prefix} ({source})')
+    await flash(f'Folder stats job {job.id} started. Status: {url_for("job_status", job_id=job.id)}', 'success')
+    return redirect(url_for('index', prefix=prefix))
+
+@app.route('/folder_stats')
+async def folder_stats():
+    prefix = normalize_prefix(request.args.get('prefix', ''))
+    stats = get_folder_stats(prefix)
+    if stats is None:
+        return jsonify({'error': f'No folder stats computed for /{prefix}'}), 404
+    return jsonify(stats)
+
+@app.route('/jobs')
+async def list_jobs():
+    return jsonify([job.to_dict() for job in jobs.list()])
+
+@app.route('/jobs/<job_id>')
+async def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Unknown job: {job_id}'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/cleanup', methods=['POST'])
+async def cleanup():
+    form = await request.form
+    prefix = normalize_prefix(form['prefix'])
+    try:
+        result = await s3_async.delete_prefix(s3, bucket_name, prefix, fanout_concurrency, report_delete_progress)
+        await flash_delete_result(result)
+    except Exception as e:
+        await flash(f'Error during cleanup: {e}', 'danger')
+    invalidate_caches(prefix, recursive=True)
+    return redirect(url_for('index', prefix=prefix))
+
+if __name__ == '__main__':
+    app.run(debug=True, port=5001)
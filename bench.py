@@ -0,0 +1,265 @@
+import io
+import sys
+import csv
+import json
+import time
+import random
+import argparse
+import threading
+from datetime import datetime
+import s3_bulk
+import s3_transfer
+import loadgen
+from histogram import LatencyHistogram
+
+"""
+S3 Benchmark Suite
+==================
+
+Runs parameterized scenarios against an S3-compatible endpoint and records the
+latency of every operation into HDR-style histograms. Each scenario reports
+per-operation count, error rate, mean/p50/p95/p99/max latency, ops/s and MB/s
+as JSON or CSV, so runs against different client settings or endpoints can be
+diffed. Objects are written under bench/<run-id>/ and removed afterwards
+unless --keep is given. Key names and sizes are seeded, so the same arguments
+produce the same workload.
+
+Scenarios:
+----------
+put_small     Small-object PUT storm
+get_large     Repeated GETs of a few large objects (multipart uploaded)
+head          HEAD requests against existing objects
+list_deep     Full paginated LIST of a prefix holding --objects keys
+batch_delete  DeleteObjects batches of up to 1000 keys
+mixed         Random GET/PUT mix over a working set (--read-ratio)
+
+Example Commands:
+-----------------
+1. All scenarios against a local MinIO, written to CSV:
+   python bench.py --endpoint-url http://localhost:9000 --bucket bench --format csv --output run.csv
+
+2. A PUT storm and mixed workload at 64-way concurrency, in-process moto mock:
+   python bench.py --moto --bucket bench --scenario put_small --scenario mixed --concurrency 64
+"""
+
+SCENARIOS = ('put_small', 'get_large', 'head', 'list_deep', 'batch_delete', 'mixed')
+CSV_FIELDS = ['scenario', 'op', 'count', 'errors', 'error_rate', 'ops_per_s', 'mb_per_s',
+              'mean', 'p50', 'p95', 'p99', 'max']
+
+class OpRecorder:
+    """ Per-operation latency histograms, error counts and byte totals for one scenario """
+    def __init__(self):
+        self.histograms = {}
+        self.errors = {}
+        self.bytes = {}
+        self.lock = threading.Lock()
+        self.started = None
+        self.elapsed = 0.0
+
+    def time(self, op, func, size=0):
+        """ Call func(), recording its latency under `op`; returns (ok, result) """
+        with self.lock:
+            histogram = self.histograms.setdefault(op, LatencyHistogram())
+        started = time.perf_counter()
+        try:
+            result = func()
+        except Exception:
+            self.add_errors(op)
+            return False, None
+        histogram.record(time.perf_counter() - started)
+        with self.lock:
+            self.bytes[op] = self.bytes.get(op, 0) + size
+        return True, result
+
+    def add_errors(self, op, count=1):
+        with self.lock:
+            self.errors[op] = self.errors.get(op, 0) + count
+
+    def run(self, tasks, handler, concurrency):
+        """ Run handler(task) over tasks with bounded concurrency, timing the whole phase """
+        def wrapped(task):
+            handler(task)
+            return 1, []
+        self.started = time.perf_counter()
+        s3_bulk.run_batches(tasks, wrapped, concurrency)
+        self.elapsed += time.perf_counter() - self.started
+
+    def results(self, scenario):
+        rows = []
+        for op in sorted(set(self.histograms) | set(self.errors)):
+            histogram = self.histograms.get(op, LatencyHistogram())
+            summary = histogram.summary()
+            count = summary.pop('count')
+            errors = self.errors.get(op, 0)
+            elapsed = self.elapsed or 1e-9
+            rows.append({
+                'scenario': scenario,
+                'op': op,
+                'count': count,
+                'errors': errors,
+                'error_rate': round(errors / (count + errors), 4) if count + errors else 0.0,
+                'ops_per_s': round(count / elapsed, 2),
+                'mb_per_s': round(self.bytes.get(op, 0) / (1024 ** 2) / elapsed, 3),
+                **summary,
+            })
+        return rows
+
+def populate(s3, bucket, prefix, count, size, concurrency, seed):
+    """ Write `count` objects of `size` bytes (untimed setup) and return their keys """
+    spec = loadgen.LoadSpec(count=count, size=size, depth=0, concurrency=concurrency, seed=seed)
+    keys = [key for key, _ in loadgen.plan_objects(prefix, spec)]
+    body = b'x' * size
+
+    def put(key):
+        s3.put_object(Bucket=bucket, Key=key, Body=body)
+        return 1, []
+
+    s3_bulk.run_batches(keys, put, concurrency)
+    return keys
+
+def scenario_put_small(s3, bucket, prefix, args, recorder):
+    body = b'x' * args.small_size
+    rng = random.Random(args.seed)
+    keys = [f'{prefix}{loadgen.generate_random_string(rng=rng)}' for _ in range(args.objects)]
+    recorder.run(keys, lambda key: recorder.time(
+        'PUT', lambda: s3.put_object(Bucket=bucket, Key=key, Body=body), args.small_size), args.concurrency)
+
+def scenario_get_large(s3, bucket, prefix, args, recorder):
+    keys = []
+    for i in range(args.large_objects):
+        key = f'{prefix}large-{i}'
+        s3_transfer.upload_stream(s3, bucket, key, io.BytesIO(b'x' * args.large_size))
+        keys.append(key)
+
+    def get(key):
+        def read():
+            body = s3.get_object(Bucket=bucket, Key=key)['Body']
+            for _ in body.iter_chunks(1024 * 1024):
+                pass
+        recorder.time('GET', read, args.large_size)
+
+    recorder.run((keys[i % len(keys)] for i in range(args.large_gets)), get, args.concurrency)
+
+def scenario_head(s3, bucket, prefix, args, recorder):
+    keys = populate(s3, bucket, prefix, args.objects, args.small_size, args.concurrency, args.seed)
+    recorder.run(keys, lambda key: recorder.time(
+        'HEAD', lambda: s3.head_object(Bucket=bucket, Key=key)), args.concurrency)
+
+def scenario_list_deep(s3, bucket, prefix, args, recorder):
+    populate(s3, bucket, prefix, args.objects, 0, args.concurrency, args.seed)
+
+    def list_all(_):
+        # Pages depend on the previous continuation token, so each pass is sequential
+        params = {'Bucket': bucket, 'Prefix': prefix, 'MaxKeys': args.page_size}
+        while True:
+            ok, response = recorder.time('LIST', lambda: s3.list_objects_v2(**params))
+            if not ok or not response.get('IsTruncated'):
+                break
+            params['ContinuationToken'] = response['NextContinuationToken']
+
+    recorder.run(range(args.list_passes), list_all, args.concurrency)
+
+def scenario_batch_delete(s3, bucket, prefix, args, recorder):
+    keys = populate(s3, bucket, prefix, args.objects, 0, args.concurrency, args.seed)
+
+    def delete(batch):
+        # delete_batch reports failures per key instead of raising
+        ok, result = recorder.time('DELETE_BATCH', lambda: s3_bulk.delete_batch(s3, bucket, batch))
+        if ok and result[1]:
+            recorder.add_errors('DELETE_BATCH', len(result[1]))
+
+    recorder.run(s3_bulk.iter_batches(keys, s3_bulk.DELETE_BATCH_SIZE), delete, args.concurrency)
+
+def scenario_mixed(s3, bucket, prefix, args, recorder):
+    keys = populate(s3, bucket, prefix, args.objects, args.small_size, args.concurrency, args.seed)
+    rng = random.Random(args.seed)
+    plan = [(rng.random() < args.read_ratio, rng.choice(keys)) for _ in range(args.mixed_ops)]
+    body = b'y' * args.small_size
+
+    def op(task):
+        is_read, key = task
+        if is_read:
+            recorder.time('GET', lambda: s3.get_object(Bucket=bucket, Key=key)['Body'].read(), args.small_size)
+        else:
+            recorder.time('PUT', lambda: s3.put_object(Bucket=bucket, Key=key, Body=body), args.small_size)
+
+    recorder.run(plan, op, args.concurrency)
+
+SCENARIO_FUNCTIONS = {
+    'put_small': scenario_put_small,
+    'get_large': scenario_get_large,
+    'head': scenario_head,
+    'list_deep': scenario_list_deep,
+    'batch_delete': scenario_batch_delete,
+    'mixed': scenario_mixed,
+}
+
+def run_benchmarks(s3, bucket, args):
+    """ Run the selected scenarios and return the report dict """
+    run_id = datetime.now().strftime('%Y%m%d%H%M%S')
+    config = s3.meta.config
+    report = {
+        'run_id': run_id,
+        'endpoint_url': s3.meta.endpoint_url,
+        'bucket': bucket,
+        'client': {
+            'max_pool_connections': config.max_pool_connections,
+            'retries': config.retries,
+            'connect_timeout': config.connect_timeout,
+            'read_timeout': config.read_timeout,
+        },
+        'params': {key: value for key, value in vars(args).items() if key not in ('output', 'format')},
+        'results': [],
+    }
+    for scenario in args.scenario or SCENARIOS:
+        prefix = f'bench/{run_id}/{scenario}/'
+        recorder = OpRecorder()
+        try:
+            SCENARIO_FUNCTIONS[scenario](s3, bucket, prefix, args, recorder)
+        finally:
+            if not args.keep:
+                s3_bulk.delete_prefix(s3, bucket, prefix, workers=args.concurrency)
+        report['results'].extend(recorder.results(scenario))
+    return report
+
+def write_report(report, output_format, stream):
+    if output_format == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=CSV_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(report['results'])
+    else:
+        json.dump(report, stream, indent=2)
+        stream.write('\n')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='S3 operation benchmark suite')
+    parser.add_argument('--endpoint-url', type=str, help='S3 endpoint (defaults to config.json / S3_ENDPOINT_URL)')
+    parser.add_argument('--bucket', type=str, help='Bucket to benchmark (defaults to config.json / S3_BUCKET)')
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS, help='Scenario to run (repeatable, default all)')
+    parser.add_argument('--objects', type=int, default=2000, help='Objects per scenario')
+    parser.add_argument('--small-size', type=loadgen.parse_size, default='4KB', help='Size of small objects')
+    parser.add_argument('--large-size', type=loadgen.parse_size, default='64MB', help='Size of large objects')
+    parser.add_argument('--large-objects', type=int, default=4, help='Number of large objects to GET')
+    parser.add_argument('--large-gets', type=int, default=32, help='Number of large GETs')
+    parser.add_argument('--page-size', type=int, default=1000, help='MaxKeys for list_deep')
+    parser.add_argument('--list-passes', type=int, default=4, help='Full listings for list_deep')
+    parser.add_argument('--mixed-ops', type=int, default=5000, help='Operations in the mixed scenario')
+    parser.add_argument('--read-ratio', type=float, default=0.8, help='Fraction of reads in the mixed scenario')
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent operations')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for key names and op mix')
+    parser.add_argument('--keep', action='store_true', help='Keep benchmark objects after the run')
+    parser.add_argument('--moto', action='store_true', help='Run against an in-process moto mock')
+    parser.add_argument('--format', choices=('json', 'csv'), default='json', help='Report format')
+    parser.add_argument('--output', type=str, help='Write the report to a file instead of stdout')
+    args = parser.parse_args(argv)
+
+    with loadgen.open_client(args.endpoint_url, args.bucket, args.concurrency, args.moto) as (s3, bucket):
+        report = run_benchmarks(s3, bucket, args)
+    if args.output:
+        with open(args.output, 'w', newline='') as f:
+            write_report(report, args.format, f)
+    else:
+        write_report(report, args.format, sys.stdout)
+
+if __name__ == '__main__':
+    main()
@@ -1,25 +1,9 @@
-import boto3
-from botocore.client import Config
-import urllib3
+import s3_client
 
-# Suppress only the single InsecureRequestWarning from urllib3 needed
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
-# AWS S3 credentials and endpoint
-aws_access_key = 'FOO'
-aws_secret_access_key = 'TBAR'
-endpoint_url = 'https://s3.amazonaws.com'
-bucket_name = 'test'
-
-# Initialize S3 client
-s3 = boto3.client(
-    's3',
-    aws_access_key_id=aws_access_key,
-    aws_secret_access_key=aws_secret_access_key,
-    endpoint_url=endpoint_url,
-    config=Config(signature_version='s3v4'),
-    verify=False
-)
+# Shared S3 client and bucket (see s3_client.py for the settings)
+settings = s3_client.load_settings()
+bucket_name = settings['bucket_name']
+s3 = s3_client.get_client()
 
 def check_bucket_exists():
     try:
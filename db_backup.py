@@ -1,6 +1,9 @@
 import os
 import sys
-import tempfile
+import time
+import zlib
+import glob
+import hashlib
 import asyncio
 import mysql.connector
 from datetime import datetime
@@ -8,6 +11,8 @@ import logging
 import argparse
 import json
 from mysql.connector import Error
+import s3_client
+import s3_transfer
 
 """
 Database Backup Script
@@ -18,20 +23,49 @@ It also includes functionality to copy data between databases on different serve
 
 Example Commands:
 -----------------
-1. Backup version 1.0.0 from dev environment:
+1. Backup version 1.0.0 from dev environment (one file per table plus manifest.json):
    python db_backup.py --version 1.0.0 --source-env dev
 
-2. Restore the entire database from a backup file:
-   python db_backup.py --version 1.0.0 --source-env dev --restore-file ./backups/1.0.0/dev/FULL_breaker19er_backup.sql
+   Tables are dumped largest-first, at most --workers at a time (default: CPU count):
+   python db_backup.py --version 1.0.0 --source-env dev --workers 8
+
+   Also write a single monolithic dump (a second pass over the database):
+   python db_backup.py --version 1.0.0 --source-env dev --full-dump
+
+   Dumps are streamed through compression (--compression gzip|zstd|none, default gzip)
+   and SHA-256 hashing. Ship them straight to the S3 bucket from config.json, with or
+   without a local copy:
+   python db_backup.py --version 1.0.0 --source-env prod --compression zstd --s3-upload --no-local
+
+   Incremental backup: only tables whose fingerprint changed since the newest manifest under
+   ./backups/1.0.0/dev are dumped; the new manifest references the earlier dumps of the rest
+   (the first incremental run dumps everything to record fingerprints). --change-detection
+   checksum uses CHECKSUM TABLE instead of information_schema statistics:
+   python db_backup.py --version 1.0.0 --source-env dev --incremental
+
+2. Restore the entire database from a full dump file (.sql, .sql.gz or .sql.zst):
+   python db_backup.py --version 1.0.0 --source-env dev --restore-file ./backups/1.0.0/dev/FULL_breaker19er_backup.sql.gz
+
+   Dumps are decompressed in-process and streamed into mysql; the SHA-256 recorded in the
+   manifest.json next to the file (or one level up) is verified, and a truncated file fails.
 
 3. Restore a specific table from a backup file:
-   python db_backup.py --version 1.0.0 --source-env dev --restore-file ./backups/1.0.0/dev/tables/breaker19er_table_name_backup.sql --restore-table-name table_name
+   python db_backup.py --version 1.0.0 --source-env dev --restore-file ./backups/1.0.0/dev/tables/breaker19er_table_name_backup.sql.gz --restore-table-name table_name
+
+   Restore a whole per-table backup set (a backup directory or its manifest.json), loading
+   up to --workers tables at once. Completed tables are checkpointed, so re-running the
+   same command after an interruption resumes where it stopped (--fresh-restore starts over):
+   python db_backup.py --version 1.0.0 --source-env test --restore-dir ./backups/1.0.0/prod --workers 8
 
 4. Copy data from dev environment to test environment:
    python db_backup.py --copy-data --source-env dev --target-env test
 
 5. Copy a specific table from dev environment to test environment:
    python db_backup.py --copy-data --source-env dev --target-env test --table-name table_name
+
+   Copies stream mysqldump straight into mysql without a temporary file. Copy tables
+   in parallel (largest first, at most --workers at a time) instead of one stream:
+   python db_backup.py --copy-data --source-env dev --target-env test --parallel-copy --workers 8
 """
 
 # Load configuration from config file
@@ -40,6 +74,28 @@ with open('config.json') as config_file:
 
 # Backup directory configuration
 BACKUP_DIR = './backups'
+MANIFEST_FILE = 'manifest.json'
+
+# Concurrent mysqldump processes per backup
+DEFAULT_WORKERS = os.cpu_count() or 4
+
+# Dump compression: 'zstd' needs the zstandard package
+COMPRESSION_EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst', 'none': ''}
+DEFAULT_COMPRESSION = 'gzip'
+STREAM_CHUNK_SIZE = 1024 * 1024
+# Concurrent part uploads per dump (the S3 client pool is shared by all dumps)
+UPLOAD_PART_WORKERS = 4
+
+# Incremental backups: 'stats' compares information_schema row counts, sizes and
+# update_time (cheap, but update_time is NULL for InnoDB on older MySQL, which
+# always counts as changed); 'checksum' runs CHECKSUM TABLE (exact, reads every row)
+CHANGE_DETECTION_METHODS = ('stats', 'checksum')
+DEFAULT_CHANGE_DETECTION = 'stats'
+
+# Session settings around each table load. Key maintenance is already deferred by the
+# ALTER TABLE ... DISABLE KEYS / ENABLE KEYS that mysqldump writes around its INSERTs.
+RESTORE_PREAMBLE = b"SET FOREIGN_KEY_CHECKS=0;\nSET UNIQUE_CHECKS=0;\n"
+RESTORE_POSTAMBLE = b"\nSET UNIQUE_CHECKS=1;\nSET FOREIGN_KEY_CHECKS=1;\n"
 
 def setup_logging(log_dir):
     """ Set up logging configuration """
@@ -61,93 +117,636 @@ async def run_command(command):
         raise Exception(f"Command failed: {command}\nError: {error.decode()}\nOutput: {output.decode()}")
     return output.decode()
 
-async def backup_database(backup_dir, db_config):
-    """ Backup the entire database """
-    backup_file = os.path.join(backup_dir, f"FULL_{db_config['database']}_backup.sql")
-    command = f"mysqldump -h {db_config['host']} -P {db_config['port']} -u {db_config['user']} -p{db_config['password']} {db_config['database']} > {backup_file}"
-    await run_command(command)
-    logging.info(f"Database backup completed: {backup_file}")
-
-async def backup_table(table_name, backup_file, db_config):
-    """ Backup a single table """
-    command = f"mysqldump -h {db_config['host']} -P {db_config['port']} -u {db_config['user']} -p{db_config['password']} {db_config['database']} {table_name} > {backup_file}"
-    await run_command(command)
-    logging.info(f"Table backup completed: {backup_file}")
-
-async def backup_tables(backup_dir, db_config):
-    """ Backup each table individually """
+def dump_args(db_config, tables=()):
+    """ Build the mysqldump argument list for a database or some of its tables """
+    return ['mysqldump', '-h', db_config['host'], '-P', str(db_config['port']), '-u', db_config['user'],
+            f"-p{db_config['password']}", db_config['database'], *tables]
+
+def client_args(db_config):
+    """ Build the mysql client argument list for a database """
+    return ['mysql', '-h', db_config['host'], '-P', str(db_config['port']), '-u', db_config['user'],
+            f"-p{db_config['password']}", db_config['database']]
+
+def make_compressor(compression):
+    """ Return an object with compress()/flush(), or None for uncompressed output """
+    if compression == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor().compressobj()
+    if compression == 'gzip':
+        # wbits=31 writes a gzip container, readable by gunzip
+        return zlib.compressobj(6, zlib.DEFLATED, 31)
+    return None
+
+class BackupSink:
+    """ Compress and hash a dump stream, writing it to a local file and/or an S3 multipart upload """
+    def __init__(self, local_file=None, s3_key=None, compression=DEFAULT_COMPRESSION):
+        self.local_file = local_file
+        self.s3_key = s3_key
+        self.compression = compression
+        self.compressor = make_compressor(compression)
+        self.digest = hashlib.sha256()
+        self.raw_bytes = 0
+        self.bytes = 0
+        self.local = None
+        self.uploader = None
+        if s3_key:
+            settings = s3_client.load_settings()
+            self.uploader = s3_transfer.MultipartUploader(s3_client.get_client(), settings['bucket_name'], s3_key,
+                                                          workers=UPLOAD_PART_WORKERS)
+        # Open the local file last so a failed S3 start leaves no empty backup file behind
+        if local_file:
+            try:
+                self.local = open(local_file, 'wb')
+            except BaseException:
+                if self.uploader:
+                    self.uploader.abort()
+                raise
+
+    def write(self, chunk):
+        self.raw_bytes += len(chunk)
+        self._emit(self.compressor.compress(chunk) if self.compressor else chunk)
+
+    def close(self):
+        if self.compressor:
+            self._emit(self.compressor.flush())
+        if self.local:
+            self.local.close()
+        if self.uploader:
+            self.uploader.complete()
+        return {
+            'file': self.local_file,
+            's3_key': self.s3_key,
+            'compression': self.compression,
+            'raw_bytes': self.raw_bytes,
+            'bytes': self.bytes,
+            'sha256': self.digest.hexdigest(),
+        }
+
+    def abort(self):
+        if self.local:
+            self.local.close()
+            if os.path.exists(self.local_file):
+                os.remove(self.local_file)
+        if self.uploader:
+            self.uploader.abort()
+
+    def _emit(self, data):
+        if not data:
+            return
+        self.digest.update(data)
+        self.bytes += len(data)
+        if self.local:
+            self.local.write(data)
+        if self.uploader:
+            self.uploader.write(data)
+
+async def stream_dump(args, sink):
+    """ Pipe a mysqldump process into a sink without staging the raw dump on disk """
+    loop = asyncio.get_running_loop()
+    logging.info(f"Running command: {' '.join(arg if not arg.startswith('-p') else '-p****' for arg in args)}")
+    process = await asyncio.create_subprocess_exec(*args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    stderr = asyncio.ensure_future(process.stderr.read())
     try:
-        connection = mysql.connector.connect(
-            host=db_config['host'],
-            port=db_config['port'],
-            user=db_config['user'],
-            password=db_config['password'],
-            database=db_config['database']
+        while True:
+            chunk = await process.stdout.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            # Compression, hashing and part uploads block, so they run off the event loop
+            await loop.run_in_executor(None, sink.write, chunk)
+        error = await stderr
+        await process.wait()
+        if process.returncode != 0:
+            raise Exception(f"mysqldump failed with exit code {process.returncode}\nError: {error.decode()}")
+        return await loop.run_in_executor(None, sink.close)
+    except BaseException:
+        if process.returncode is None:
+            process.kill()
+            # Drain what the killed dump left in its pipe, otherwise wait() never sees EOF
+            await process.stdout.read()
+            await process.wait()
+        await loop.run_in_executor(None, sink.abort)
+        raise
+
+def s3_key_for(s3_prefix, backup_file):
+    return f"{s3_prefix}{os.path.basename(backup_file)}" if s3_prefix is not None else None
+
+async def backup_database(backup_dir, db_config, compression=DEFAULT_COMPRESSION, s3_prefix=None, keep_local=True):
+    """ Backup the entire database and return its manifest entry (file relative to backup_dir) """
+    backup_file = os.path.join(backup_dir, f"FULL_{db_config['database']}_backup.sql{COMPRESSION_EXTENSIONS[compression]}")
+    started = time.monotonic()
+    loop = asyncio.get_running_loop()
+    sink = await loop.run_in_executor(None, BackupSink, backup_file if keep_local else None, s3_key_for(s3_prefix, backup_file), compression)
+    result = await stream_dump(dump_args(db_config), sink)
+    logging.info(f"Database backup completed: {backup_file} ({result['bytes']} bytes, sha256 {result['sha256']})")
+    return {
+        **result,
+        'file': os.path.relpath(backup_file, backup_dir) if keep_local else None,
+        'duration_s': round(time.monotonic() - started, 3),
+    }
+
+async def backup_table(table_name, backup_file, db_config, compression=DEFAULT_COMPRESSION, s3_key=None, keep_local=True):
+    """ Backup a single table and return its sizes, checksum and duration """
+    started = time.monotonic()
+    loop = asyncio.get_running_loop()
+    sink = await loop.run_in_executor(None, BackupSink, backup_file if keep_local else None, s3_key, compression)
+    result = await stream_dump(dump_args(db_config, [table_name]), sink)
+    duration = time.monotonic() - started
+    logging.info(f"Table backup completed: {backup_file} ({result['raw_bytes']} bytes dumped, {result['bytes']} stored in {duration:.1f}s)")
+    return {**result, 'duration_s': round(duration, 3)}
+
+def get_connection(db_config):
+    """ Open a MySQL connection for the given environment config """
+    return mysql.connector.connect(
+        host=db_config['host'],
+        port=db_config['port'],
+        user=db_config['user'],
+        password=db_config['password'],
+        database=db_config['database']
+    )
+
+def get_table_sizes(db_config):
+    """ Return [(table_name, estimated_bytes)] for every table, largest first """
+    connection = get_connection(db_config)
+    try:
+        cursor = connection.cursor()
+        cursor.execute(
+            "SELECT table_name, COALESCE(data_length, 0) + COALESCE(index_length, 0) AS size "
+            "FROM information_schema.tables WHERE table_schema = %s "
+            "ORDER BY size DESC, table_name",
+            (db_config['database'],)
         )
+        tables = [(table_name, int(size)) for table_name, size in cursor.fetchall()]
+        cursor.close()
+        return tables
+    finally:
+        connection.close()
+
+def quote_identifier(name):
+    return '`' + name.replace('`', '``') + '`'
+
+def get_table_fingerprints(db_config, method=DEFAULT_CHANGE_DETECTION):
+    """ Return {table_name: fingerprint}; a None fingerprint means the table must be dumped """
+    connection = get_connection(db_config)
+    try:
         cursor = connection.cursor()
-        cursor.execute("SHOW TABLES")
-        tables = cursor.fetchall()
-        table_backup_dir = os.path.join(backup_dir, 'tables')
-        os.makedirs(table_backup_dir, exist_ok=True)
-        tasks = []
-        for (table_name,) in tables:
-            backup_file = os.path.join(table_backup_dir, f"{db_config['database']}_{table_name}_backup.sql")
-            tasks.append(backup_table(table_name, backup_file, db_config))
-        await asyncio.gather(*tasks)
+        cursor.execute(
+            "SELECT table_name, table_rows, data_length, index_length, auto_increment, update_time "
+            "FROM information_schema.tables WHERE table_schema = %s",
+            (db_config['database'],)
+        )
+        rows = cursor.fetchall()
+        if method == 'checksum':
+            fingerprints = {}
+            names = [row[0] for row in rows]
+            if names:
+                cursor.execute("CHECKSUM TABLE " + ', '.join(quote_identifier(name) for name in names))
+                for qualified_name, checksum in cursor.fetchall():
+                    table_name = qualified_name.split('.', 1)[1]
+                    fingerprints[table_name] = f"checksum:{checksum}" if checksum is not None else None
+        else:
+            fingerprints = {
+                table_name: f"stats:{update_time.isoformat()}:{table_rows}:{data_length}:{index_length}:{auto_increment}"
+                if update_time is not None else None
+                for table_name, table_rows, data_length, index_length, auto_increment, update_time in rows
+            }
         cursor.close()
+        return fingerprints
+    finally:
         connection.close()
+
+def find_previous_manifest(env_backup_dir, current_backup_dir):
+    """ Return the path of the newest manifest under BACKUP_DIR/<version>/<env>, other than the current run's """
+    candidates = [os.path.join(env_backup_dir, MANIFEST_FILE)] + glob.glob(os.path.join(env_backup_dir, '*', MANIFEST_FILE))
+    current = os.path.abspath(os.path.join(current_backup_dir, MANIFEST_FILE))
+    newest, newest_created = None, ''
+    for manifest_file in candidates:
+        if os.path.abspath(manifest_file) == current or not os.path.exists(manifest_file):
+            continue
+        try:
+            with open(manifest_file) as f:
+                created = json.load(f).get('created', '')
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable manifest {manifest_file}: {e}")
+            continue
+        if created > newest_created:
+            newest, newest_created = manifest_file, created
+    return newest
+
+def reusable_entries(base_manifest, backup_dir, db_config, method, fingerprints):
+    """ Map table name -> previous manifest entry, re-pathed for `backup_dir`, for every unchanged table """
+    with open(base_manifest) as f:
+        previous = json.load(f)
+    if previous.get('database') != db_config['database'] or previous.get('change_detection') != method:
+        logging.info(f"Previous manifest {base_manifest} was not taken with {method} change detection; dumping every table")
+        return {}
+    base_dir = os.path.dirname(base_manifest)
+    reusable = {}
+    for entry in previous['tables']:
+        fingerprint = entry.get('fingerprint')
+        if fingerprint is None or fingerprint != fingerprints.get(entry['table']):
+            continue
+        entry = dict(entry)
+        if entry.get('file'):
+            local_file = os.path.join(base_dir, entry['file'])
+            if not os.path.exists(local_file):
+                if not entry.get('s3_key'):
+                    continue
+                entry['file'] = None
+            else:
+                entry['file'] = os.path.relpath(local_file, backup_dir)
+        elif not entry.get('s3_key'):
+            continue
+        # Keep pointing at the run that actually dumped the table, however many runs ago
+        entry.setdefault('reused_from', os.path.relpath(base_dir, BACKUP_DIR).replace(os.sep, '/'))
+        entry['duration_s'] = 0.0
+        reusable[entry['table']] = entry
+    return reusable
+
+def write_manifest(backup_dir, manifest, s3_prefix=None):
+    """ Write the backup manifest next to the dumps (and to S3 when uploading) """
+    manifest_file = os.path.join(backup_dir, MANIFEST_FILE)
+    with open(manifest_file, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    logging.info(f"Backup manifest written: {manifest_file}")
+    if s3_prefix is not None:
+        settings = s3_client.load_settings()
+        s3_client.get_client().put_object(
+            Bucket=settings['bucket_name'],
+            Key=f"{s3_prefix}{MANIFEST_FILE}",
+            Body=json.dumps(manifest, indent=2).encode('utf-8')
+        )
+        logging.info(f"Backup manifest uploaded: {s3_prefix}{MANIFEST_FILE}")
+    return manifest_file
+
+async def backup_tables(backup_dir, db_config, workers=DEFAULT_WORKERS, compression=DEFAULT_COMPRESSION, s3_prefix=None, keep_local=True,
+                        change_detection=None, base_manifest=None, full_dump=None):
+    """ Backup each table individually, largest first, with at most `workers` dumps running
+
+    With `change_detection` set, every entry records the table's fingerprint and tables whose
+    fingerprint matches `base_manifest` are referenced from that backup instead of dumped again.
+    `full_dump` is the backup_database() result of this run, recorded in the manifest.
+    A failed table does not stop the others: the manifest lists the completed tables and
+    the failures, then an exception reports them.
+    """
+    try:
+        tables = get_table_sizes(db_config)
+        # Fingerprints are taken before dumping: a table written to mid-dump gets dumped again next run
+        fingerprints = get_table_fingerprints(db_config, change_detection) if change_detection else {}
     except Error as e:
         logging.error(f"Error while connecting to MySQL: {e}")
         raise
+    reusable = {}
+    if change_detection and base_manifest:
+        reusable = reusable_entries(base_manifest, backup_dir, db_config, change_detection, fingerprints)
+        logging.info(f"Incremental backup against {base_manifest}: {len(reusable)} of {len(tables)} tables unchanged")
+    elif change_detection:
+        logging.info("No previous manifest to compare against; dumping every table")
+    table_backup_dir = os.path.join(backup_dir, 'tables')
+    os.makedirs(table_backup_dir, exist_ok=True)
+    semaphore = asyncio.Semaphore(workers)
+    started = time.monotonic()
+
+    async def run(table_name, estimated_bytes):
+        if table_name in reusable:
+            return {**reusable[table_name], 'estimated_bytes': estimated_bytes}
+        backup_file = os.path.join(table_backup_dir, f"{db_config['database']}_{table_name}_backup.sql{COMPRESSION_EXTENSIONS[compression]}")
+        s3_key = s3_key_for(f"{s3_prefix}tables/" if s3_prefix is not None else None, backup_file)
+        # Tasks are created largest-first and the semaphore wakes waiters in order,
+        # so the biggest tables start early instead of finishing last
+        async with semaphore:
+            result = await backup_table(table_name, backup_file, db_config, compression, s3_key, keep_local)
+        entry = {
+            'table': table_name,
+            'estimated_bytes': estimated_bytes,
+            **result,
+            'file': os.path.relpath(backup_file, backup_dir) if keep_local else None,
+        }
+        if change_detection:
+            entry['fingerprint'] = fingerprints.get(table_name)
+        return entry
+
+    results = await asyncio.gather(*(run(table_name, size) for table_name, size in tables), return_exceptions=True)
+    entries = [result for result in results if not isinstance(result, BaseException)]
+    failures = {table_name: str(result) for (table_name, _), result in zip(tables, results) if isinstance(result, BaseException)}
+    for table_name, error in failures.items():
+        logging.error(f"Table {table_name} was not backed up: {error}")
+    dumped = [entry for entry in entries if 'reused_from' not in entry]
+    manifest = {
+        'database': db_config['database'],
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'workers': workers,
+        'compression': compression,
+        's3_prefix': s3_prefix,
+        'change_detection': change_detection,
+        'base_manifest': os.path.relpath(base_manifest, backup_dir) if base_manifest and change_detection else None,
+        'duration_s': round(time.monotonic() - started, 3),
+        'raw_bytes': sum(entry['raw_bytes'] for entry in entries),
+        'bytes': sum(entry['bytes'] for entry in entries),
+        'dumped_tables': len(dumped),
+        'dumped_bytes': sum(entry['bytes'] for entry in dumped),
+        'full_dump': full_dump,
+        'tables': entries,
+        'failed_tables': failures,
+    }
+    write_manifest(backup_dir, manifest, s3_prefix)
+    logging.info(f"Backed up {len(entries)} tables ({len(dumped)} dumped, {manifest['dumped_bytes']} bytes written) "
+                 f"in {manifest['duration_s']:.1f}s with {workers} workers")
+    if failures:
+        raise Exception(f"{len(failures)} of {len(tables)} tables failed to back up: {', '.join(sorted(failures))}")
+    return manifest
+
+async def pipe_dump_to_restore(source_db_config, target_db_config, tables=()):
+    """ Stream mysqldump from the source straight into mysql on the target """
+    started = time.monotonic()
+    dump = await asyncio.create_subprocess_exec(*dump_args(source_db_config, tables),
+                                                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    load = await asyncio.create_subprocess_exec(*client_args(target_db_config), stdin=asyncio.subprocess.PIPE,
+                                                stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+    dump_error = asyncio.ensure_future(dump.stderr.read())
+    load_error = asyncio.ensure_future(load.stderr.read())
+    copied = 0
+    try:
+        while True:
+            chunk = await dump.stdout.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            load.stdin.write(chunk)
+            # Backpressure: stop reading the dump while mysql is behind
+            await load.stdin.drain()
+            copied += len(chunk)
+        load.stdin.close()
+        await asyncio.gather(dump.wait(), load.wait())
+    except (BrokenPipeError, ConnectionResetError):
+        # mysql exited early; its stderr explains why
+        pass
+    finally:
+        for process in (dump, load):
+            if process.returncode is None:
+                process.kill()
+        # Drain what a killed dump left in its pipe, otherwise wait() never sees EOF
+        await dump.stdout.read()
+        await asyncio.gather(dump.wait(), load.wait())
+    if dump.returncode != 0 or load.returncode != 0:
+        raise Exception(f"Copy of {', '.join(tables) or source_db_config['database']} failed: "
+                        f"mysqldump exit {dump.returncode}: {(await dump_error).decode()} "
+                        f"mysql exit {load.returncode}: {(await load_error).decode()}")
+    duration = time.monotonic() - started
+    return {'bytes': copied, 'duration_s': round(duration, 3), 'mb_per_s': round(copied / (1024 ** 2) / duration, 2) if duration else 0.0}
+
+def compression_for(path):
+    """ Infer the compression of a backup file from its extension """
+    for compression, extension in COMPRESSION_EXTENSIONS.items():
+        if extension and path.endswith(extension):
+            return compression
+    return 'none'
+
+def make_decompressor(compression):
+    """ Return an object with decompress()/flush(), or None for uncompressed input """
+    if compression == 'zstd':
+        import zstandard
+        return zstandard.ZstdDecompressor().decompressobj()
+    if compression == 'gzip':
+        return zlib.decompressobj(31)
+    return None
+
+def describe_entry(entry):
+    """ 'table <name>' for table dumps, the file (or S3 key) for full dumps """
+    if entry.get('table'):
+        return f"table {entry['table']}"
+    return entry.get('file') or entry.get('s3_key')
+
+class BackupReader:
+    """ Read a dump from its local file (or S3 when only uploaded), decompressing and hashing it """
+    def __init__(self, entry, base_dir):
+        self.entry = entry
+        local_file = os.path.join(base_dir, entry['file']) if entry.get('file') else None
+        if local_file and os.path.exists(local_file):
+            self.stream = open(local_file, 'rb')
+            source = local_file
+        elif entry.get('s3_key'):
+            settings = s3_client.load_settings()
+            self.stream = s3_client.get_client().get_object(Bucket=settings['bucket_name'], Key=entry['s3_key'])['Body']
+            source = entry['s3_key']
+        else:
+            raise FileNotFoundError(f"No backup file for {describe_entry(entry)}: {local_file}")
+        self.decompressor = make_decompressor(entry.get('compression') or compression_for(source))
+        self.digest = hashlib.sha256()
+        self.finished = False
+
+    def read(self):
+        """ Return the next chunk of SQL, or b'' at the end """
+        while not self.finished:
+            data = self.stream.read(STREAM_CHUNK_SIZE)
+            if not data:
+                self.finished = True
+                if not self.decompressor:
+                    return b''
+                output = self.decompressor.flush()
+                # A truncated file decompresses cleanly up to the cut; only the missing end marker tells
+                if not getattr(self.decompressor, 'eof', True):
+                    raise Exception(f"Backup of {describe_entry(self.entry)} is truncated")
+                return output
+            self.digest.update(data)
+            output = self.decompressor.decompress(data) if self.decompressor else data
+            if output:
+                return output
+        return b''
+
+    def verify(self):
+        expected = self.entry.get('sha256')
+        if expected and expected != self.digest.hexdigest():
+            raise Exception(f"Checksum mismatch for {describe_entry(self.entry)}: expected {expected}, got {self.digest.hexdigest()}")
+
+    def close(self):
+        self.stream.close()
+
+def load_backup_set(path, database=None):
+    """ Return (base_dir, table entries) from a backup directory or manifest file
+
+    Without a manifest, table names come from the <database>_<table>_backup.sql file names.
+    """
+    manifest_file = path if os.path.isfile(path) else os.path.join(path, MANIFEST_FILE)
+    base_dir = os.path.dirname(manifest_file)
+    if os.path.exists(manifest_file):
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+        if manifest.get('failed_tables'):
+            logging.warning(f"Backup set {base_dir} is missing tables that failed to back up: {', '.join(sorted(manifest['failed_tables']))}")
+        return base_dir, manifest['tables']
+    # Older backups without a manifest: every file in tables/ is one table
+    entries = []
+    for backup_file in sorted(glob.glob(os.path.join(path, 'tables', '*_backup.sql*'))):
+        table_name = os.path.basename(backup_file).split('_backup.sql')[0]
+        if database and table_name.startswith(f"{database}_"):
+            table_name = table_name[len(database) + 1:]
+        entries.append({
+            'table': table_name,
+            'file': os.path.relpath(backup_file, path),
+            'bytes': os.path.getsize(backup_file),
+        })
+    return path, entries
+
+async def load_table(entry, base_dir, db_config):
+    """ Stream one dump into mysql with FK/unique checks disabled """
+    loop = asyncio.get_running_loop()
+    started = time.monotonic()
+    reader = await loop.run_in_executor(None, BackupReader, entry, base_dir)
+    load = await asyncio.create_subprocess_exec(*client_args(db_config), stdin=asyncio.subprocess.PIPE,
+                                                stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+    load_error = asyncio.ensure_future(load.stderr.read())
+    loaded = 0
+    try:
+        load.stdin.write(RESTORE_PREAMBLE)
+        while True:
+            chunk = await loop.run_in_executor(None, reader.read)
+            if not chunk:
+                break
+            load.stdin.write(chunk)
+            await load.stdin.drain()
+            loaded += len(chunk)
+        # A corrupt file must not be checkpointed; the next run reloads it (dumps start with DROP TABLE)
+        reader.verify()
+        load.stdin.write(RESTORE_POSTAMBLE)
+        load.stdin.close()
+        await load.wait()
+    except (BrokenPipeError, ConnectionResetError):
+        # mysql exited early; its stderr explains why
+        pass
+    finally:
+        if load.returncode is None:
+            load.kill()
+        await load.wait()
+        await loop.run_in_executor(None, reader.close)
+    if load.returncode != 0:
+        raise Exception(f"Restore of {describe_entry(entry)} failed: mysql exit {load.returncode}: {(await load_error).decode()}")
+    return {'table': entry.get('table'), 'bytes': loaded, 'duration_s': round(time.monotonic() - started, 3)}
+
+def find_backup_entry(backup_file):
+    """ Return (base_dir, manifest entry) for a dump file, from the manifest next to it or one level up
+
+    Dumps without a manifest get a bare entry, which is restored without a checksum.
+    """
+    backup_file = os.path.abspath(backup_file)
+    for base_dir in (os.path.dirname(backup_file), os.path.dirname(os.path.dirname(backup_file))):
+        manifest_file = os.path.join(base_dir, MANIFEST_FILE)
+        if not os.path.exists(manifest_file):
+            continue
+        try:
+            with open(manifest_file) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable manifest {manifest_file}: {e}")
+            continue
+        entries = manifest.get('tables', []) + ([manifest['full_dump']] if manifest.get('full_dump') else [])
+        for entry in entries:
+            if entry.get('file') and os.path.abspath(os.path.join(base_dir, entry['file'])) == backup_file:
+                return base_dir, entry
+    logging.warning(f"No manifest entry for {backup_file}; restoring without checksum verification")
+    return os.path.dirname(backup_file), {'file': os.path.basename(backup_file)}
 
 async def restore_database(backup_file, db_config):
     """ Restore the entire database from a backup file """
-    command = f"mysql -h {db_config['host']} -P {db_config['port']} -u {db_config['user']} -p{db_config['password']} {db_config['database']} < {backup_file}"
-    await run_command(command)
-    logging.info(f"Database restored from backup: {backup_file}")
+    base_dir, entry = find_backup_entry(backup_file)
+    result = await load_table({**entry, 'table': None}, base_dir, db_config)
+    logging.info(f"Database restored from backup: {backup_file} ({result['bytes']} bytes in {result['duration_s']:.1f}s)")
+    return result
 
 async def restore_table(table_name, backup_file, db_config):
     """ Restore a specific table from a backup file """
-    command = f"mysql -h {db_config['host']} -P {db_config['port']} -u {db_config['user']} -p{db_config['password']} {db_config['database']} < {backup_file}"
-    await run_command(command)
-    logging.info(f"Table {table_name} restored from backup: {backup_file}")
+    base_dir, entry = find_backup_entry(backup_file)
+    result = await load_table({**entry, 'table': table_name}, base_dir, db_config)
+    logging.info(f"Table {table_name} restored from backup: {backup_file} ({result['bytes']} bytes in {result['duration_s']:.1f}s)")
+    return result
+
+def read_checkpoint(checkpoint_file):
+    """ Return the set of tables already restored according to the checkpoint file """
+    if not os.path.exists(checkpoint_file):
+        return set()
+    with open(checkpoint_file) as f:
+        return {json.loads(line)['table'] for line in f if line.strip()}
+
+async def restore_backup_set(path, db_config, workers=DEFAULT_WORKERS, fresh=False):
+    """ Restore every table of a backup set in parallel, skipping tables checkpointed by a previous run """
+    base_dir, entries = load_backup_set(path, db_config['database'])
+    checkpoint_file = os.path.join(base_dir, f"restore_checkpoint_{db_config['host']}_{db_config['database']}.jsonl")
+    if fresh and os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+    done = read_checkpoint(checkpoint_file)
+    pending = [entry for entry in entries if entry['table'] not in done]
+    # Largest first so the longest loads overlap with everything else
+    pending.sort(key=lambda entry: entry.get('raw_bytes', entry.get('bytes', 0)), reverse=True)
+    logging.info(f"Restoring {len(pending)} tables from {base_dir} ({len(done)} already restored) with {workers} workers")
+    semaphore = asyncio.Semaphore(workers)
+    started = time.monotonic()
+
+    async def restore(entry):
+        async with semaphore:
+            result = await load_table(entry, base_dir, db_config)
+        with open(checkpoint_file, 'a') as f:
+            f.write(json.dumps({**result, 'sha256': entry.get('sha256'), 'finished': datetime.now().isoformat(timespec='seconds')}) + '\n')
+        logging.info(f"Table {result['table']} restored: {result['bytes']} bytes in {result['duration_s']:.1f}s")
+        return result
 
-async def copy_data_between_databases(source_env, target_env, table_name=None):
+    results = await asyncio.gather(*(restore(entry) for entry in pending), return_exceptions=True)
+    failures = [(entry['table'], result) for entry, result in zip(pending, results) if isinstance(result, BaseException)]
+    for table, error in failures:
+        logging.error(f"Table {table} was not restored: {error}")
+    logging.info(f"Restored {len(pending) - len(failures)} tables in {time.monotonic() - started:.1f}s")
+    if failures:
+        raise Exception(f"{len(failures)} tables failed to restore; re-run to resume from {checkpoint_file}")
+    return results
+
+async def copy_data_between_databases(source_env, target_env, table_name=None, parallel=False, workers=DEFAULT_WORKERS):
     """ Copy data from the source database to the target database """
     try:
         source_db_config = config[source_env]
         target_db_config = config[target_env]
 
-        # Create a temporary backup file
-        temp_dir = tempfile.gettempdir()
-        temp_backup_file = os.path.join(temp_dir, f"{source_db_config['database']}_temp_backup.sql")
+        if table_name or not parallel:
+            # One stream for the requested table or the whole database
+            tables = [table_name] if table_name else []
+            result = await pipe_dump_to_restore(source_db_config, target_db_config, tables)
+            logging.info(f"Copied {table_name or source_db_config['database']} to {target_env}: "
+                         f"{result['bytes']} bytes in {result['duration_s']:.1f}s ({result['mb_per_s']} MB/s)")
+            return [{'table': table_name, **result}]
 
-        # Backup the source database or table
-        if table_name:
-            command = f"mysqldump -h {source_db_config['host']} -P {source_db_config['port']} -u {source_db_config['user']} -p{source_db_config['password']} {source_db_config['database']} {table_name} > {temp_backup_file}"
-        else:
-            command = f"mysqldump -h {source_db_config['host']} -P {source_db_config['port']} -u {source_db_config['user']} -p{source_db_config['password']} {source_db_config['database']} > {temp_backup_file}"
-        await run_command(command)
-        logging.info(f"Temporary backup of source database completed: {temp_backup_file}")
-
-        # Restore the backup to the target database or table
-        command = f"mysql -h {target_db_config['host']} -P {target_db_config['port']} -u {target_db_config['user']} -p{target_db_config['password']} {target_db_config['database']} < {temp_backup_file}"
-        await run_command(command)
-        logging.info(f"Data copied to target database from backup: {temp_backup_file}")
-
-        # Clean up the temporary backup file
-        os.remove(temp_backup_file)
-        logging.info(f"Temporary backup file removed: {temp_backup_file}")
+        # One stream per table, largest first, at most `workers` at a time
+        semaphore = asyncio.Semaphore(workers)
+
+        async def copy_table(name):
+            async with semaphore:
+                result = await pipe_dump_to_restore(source_db_config, target_db_config, [name])
+            logging.info(f"Copied table {name} to {target_env}: {result['bytes']} bytes in {result['duration_s']:.1f}s ({result['mb_per_s']} MB/s)")
+            return {'table': name, **result}
+
+        tables = get_table_sizes(source_db_config)
+        started = time.monotonic()
+        # A failed table must not cancel the other streams, so every outcome is collected
+        outcomes = await asyncio.gather(*(copy_table(name) for name, _ in tables), return_exceptions=True)
+        results = [outcome for outcome in outcomes if not isinstance(outcome, BaseException)]
+        failures = [(name, outcome) for (name, _), outcome in zip(tables, outcomes) if isinstance(outcome, BaseException)]
+        for name, error in failures:
+            logging.error(f"Table {name} was not copied to {target_env}: {error}")
+        total = sum(result['bytes'] for result in results)
+        logging.info(f"Copied {len(results)} tables ({total} bytes) to {target_env} in {time.monotonic() - started:.1f}s with {workers} workers")
+        if failures:
+            raise Exception(f"{len(failures)} of {len(tables)} tables failed to copy to {target_env}: "
+                            f"{', '.join(name for name, _ in failures)}")
+        return results
     except Exception as e:
         logging.error(f"An error occurred while copying data between databases: {e}")
         raise
 
-async def main(version=None, restore_file=None, restore_table_name=None, copy_data=False, source_env=None, target_env=None, table_name=None):
+async def main(version=None, restore_file=None, restore_table_name=None, copy_data=False, source_env=None, target_env=None, table_name=None,
+               workers=DEFAULT_WORKERS, full_dump=False, compression=DEFAULT_COMPRESSION, s3_upload=False, keep_local=True, parallel_copy=False,
+               restore_dir=None, fresh_restore=False, incremental=False, change_detection=DEFAULT_CHANGE_DETECTION):
     """ Main function to perform backup, restore, and copy operations """
     try:
         # Ensure source environment is provided for backup and restore operations
         if not copy_data and not source_env:
             raise ValueError("Source environment must be specified for backup and restore operations.")
+        if not keep_local and not s3_upload:
+            raise ValueError("--no-local requires --s3-upload, otherwise the backup is not stored anywhere.")
         
         if copy_data:
             # Set up logging for data copying operations
@@ -155,7 +754,7 @@ async def main(version=None, restore_file=None, restore_table_name=None, copy_da
             backup_dir = os.path.join(BACKUP_DIR, env_dir, datetime.now().strftime('%Y%m%d%H%M%S'))
             os.makedirs(backup_dir, exist_ok=True)
             setup_logging(backup_dir)
-            await copy_data_between_databases(source_env, target_env, table_name)
+            await copy_data_between_databases(source_env, target_env, table_name, parallel_copy, workers)
         else:
             # Define backup directory for backup and restore operations
             env_dir = os.path.join(version, source_env)
@@ -170,14 +769,26 @@ async def main(version=None, restore_file=None, restore_table_name=None, copy_da
             # Set up logging for backup and restore operations
             setup_logging(backup_dir)
 
-            if restore_file:
+            if restore_dir:
+                await restore_backup_set(restore_dir, config[source_env], workers, fresh_restore)
+            elif restore_file:
                 if restore_table_name:
                     await restore_table(restore_table_name, restore_file, config[source_env])
                 else:
                     await restore_database(restore_file, config[source_env])
             else:
-                await backup_database(backup_dir, config[source_env])
-                await backup_tables(backup_dir, config[source_env])
+                # Mirror the local backup directory layout under backups/ in the bucket
+                s3_prefix = None
+                if s3_upload:
+                    s3_prefix = 'backups/' + os.path.relpath(backup_dir, BACKUP_DIR).replace(os.sep, '/') + '/'
+                full_dump_entry = None
+                if full_dump:
+                    full_dump_entry = await backup_database(backup_dir, config[source_env], compression, s3_prefix, keep_local)
+                base_manifest = None
+                if incremental:
+                    base_manifest = find_previous_manifest(os.path.join(BACKUP_DIR, env_dir), backup_dir)
+                await backup_tables(backup_dir, config[source_env], workers, compression, s3_prefix, keep_local,
+                                    change_detection if incremental else None, base_manifest, full_dump_entry)
     except Exception as e:
         logging.error(f"An error occurred: {e}")
         print(f"An error occurred: {e}")
@@ -191,5 +802,17 @@ if __name__ == "__main__":
     parser.add_argument('--copy-data', action='store_true', help='Copy data from source to target database')
     parser.add_argument('--target-env', type=str, help='Target environment (e.g., dev, test, prod)', required='--copy-data' in sys.argv)
     parser.add_argument('--table-name', type=str, help='Name of the table to copy (optional)')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Maximum concurrent table dumps (default: CPU count)')
+    parser.add_argument('--full-dump', action='store_true', help='Also write a single FULL_<database>_backup.sql dump')
+    parser.add_argument('--compression', choices=sorted(COMPRESSION_EXTENSIONS), default=DEFAULT_COMPRESSION, help='Dump compression (default: gzip)')
+    parser.add_argument('--s3-upload', action='store_true', help='Stream dumps to the S3 bucket configured in config.json')
+    parser.add_argument('--no-local', action='store_true', help='Do not keep a local copy of uploaded dumps')
+    parser.add_argument('--parallel-copy', action='store_true', help='Copy tables in parallel streams (up to --workers) instead of one stream')
+    parser.add_argument('--restore-dir', type=str, help='Backup directory or manifest.json to restore table by table in parallel')
+    parser.add_argument('--fresh-restore', action='store_true', help='Ignore the restore checkpoint and load every table again')
+    parser.add_argument('--incremental', action='store_true', help='Only dump tables changed since the previous backup of this version and environment')
+    parser.add_argument('--change-detection', choices=CHANGE_DETECTION_METHODS, default=DEFAULT_CHANGE_DETECTION, help='How --incremental detects changed tables (default: stats)')
     args = parser.parse_args()
-    asyncio.run(main(args.version, args.restore_file, args.restore_table_name, args.copy_data, args.source_env, args.target_env, args.table_name))
+    asyncio.run(main(args.version, args.restore_file, args.restore_table_name, args.copy_data, args.source_env, args.target_env, args.table_name,
+                     args.workers, args.full_dump, args.compression, args.s3_upload, not args.no_local, args.parallel_copy,
+                     args.restore_dir, args.fresh_restore, args.incremental, args.change_detection))
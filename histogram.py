@@ -0,0 +1,85 @@
+import threading
+
+"""
+Latency Histogram
+=================
+
+HDR-style histogram for operation latencies. Values are recorded in
+microseconds into power-of-two ranges that are each split into 2^(bits-1)
+linear sub-buckets, so every recorded value keeps a bounded relative error
+(under 1% with the default 8 bits) while memory stays proportional to the
+number of distinct buckets touched, not the number of samples.
+"""
+
+DEFAULT_SIGNIFICANT_BITS = 8
+
+class LatencyHistogram:
+    """ Thread-safe log-linear histogram of latencies """
+    def __init__(self, significant_bits=DEFAULT_SIGNIFICANT_BITS):
+        self.bits = significant_bits
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.lock = threading.Lock()
+
+    def _bucket(self, micros):
+        shift = max(0, micros.bit_length() - self.bits)
+        return shift, micros >> shift
+
+    @staticmethod
+    def _bucket_value(bucket):
+        # Midpoint of the bucket's value range, in microseconds
+        shift, sub = bucket
+        return ((sub << shift) + ((sub + 1) << shift) - 1) / 2
+
+    def record(self, seconds):
+        micros = max(0, int(seconds * 1_000_000))
+        bucket = self._bucket(micros)
+        with self.lock:
+            self.counts[bucket] = self.counts.get(bucket, 0) + 1
+            self.count += 1
+            self.total += seconds
+            self.min = seconds if self.min is None else min(self.min, seconds)
+            self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def merge(self, other):
+        with other.lock:
+            counts = dict(other.counts)
+            count, total, low, high = other.count, other.total, other.min, other.max
+        with self.lock:
+            for bucket, n in counts.items():
+                self.counts[bucket] = self.counts.get(bucket, 0) + n
+            self.count += count
+            self.total += total
+            if low is not None:
+                self.min = low if self.min is None else min(self.min, low)
+                self.max = high if self.max is None else max(self.max, high)
+
+    def percentile(self, fraction):
+        """ Latency in seconds at or below which `fraction` of the samples fall """
+        with self.lock:
+            if not self.count:
+                return 0.0
+            target = max(1, fraction * self.count)
+            seen = 0
+            for bucket in sorted(self.counts):
+                seen += self.counts[bucket]
+                if seen >= target:
+                    # Never report beyond the exact extremes we have seen
+                    value = self._bucket_value(bucket) / 1_000_000
+                    return min(max(value, self.min), self.max)
+            return self.max
+
+    def summary(self):
+        """ Count, mean and p50/p95/p99/max in milliseconds """
+        mean = self.total / self.count if self.count else 0.0
+        return {
+            'count': self.count,
+            'mean': round(mean * 1000, 3),
+            'p50': round(self.percentile(0.50) * 1000, 3),
+            'p95': round(self.percentile(0.95) * 1000, 3),
+            'p99': round(self.percentile(0.99) * 1000, 3),
+            'max': round((self.max or 0.0) * 1000, 3),
+        }
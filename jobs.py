@@ -0,0 +1,124 @@
+import time
+import uuid
+import asyncio
+import threading
+import traceback
+from collections import OrderedDict
+
+"""
+Background Jobs
+===============
+
+Minimal in-process job runner for long operations started from the web UI.
+Each job runs on its own daemon thread (or, with submit_task(), as an asyncio
+task on the running event loop); the function receives the Job so it can
+publish progress, and its return value becomes the job result. Status is
+exposed as plain dicts for the JSON status endpoints.
+"""
+
+DEFAULT_MAX_JOBS = 100
+
+class Job:
+    """ State of one background operation """
+    def __init__(self, kind, description=''):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.description = description
+        self.status = 'pending'
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    @property
+    def done(self):
+        return self.status in ('succeeded', 'failed', 'cancelled')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'description': self.description,
+            'status': self.status,
+            'progress': dict(self.progress),
+            'result': self.result,
+            'error': self.error,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+        }
+
+class JobRegistry:
+    """ Start jobs on background threads and keep the most recent ones for status lookups """
+    def __init__(self, max_jobs=DEFAULT_MAX_JOBS):
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        # The event loop only keeps weak references to tasks
+        self.tasks = set()
+
+    def submit(self, kind, func, *args, description='', **kwargs):
+        job = Job(kind, description)
+        with self.lock:
+            self.jobs[job.id] = job
+            self._prune()
+        thread = threading.Thread(target=self._run, args=(job, func, args, kwargs), name=f'{kind}-{job.id}', daemon=True)
+        thread.start()
+        return job
+
+    def submit_task(self, kind, func, *args, description='', **kwargs):
+        """ Run the coroutine function func(job, ...) as a task on the running event loop """
+        job = Job(kind, description)
+        with self.lock:
+            self.jobs[job.id] = job
+            self._prune()
+        task = asyncio.get_running_loop().create_task(self._run_task(job, func, args, kwargs), name=f'{kind}-{job.id}')
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self.lock:
+            return list(self.jobs.values())
+
+    def _run(self, job, func, args, kwargs):
+        job.status = 'running'
+        job.started = time.time()
+        try:
+            job.result = func(job, *args, **kwargs)
+            job.status = 'succeeded'
+        except Exception as e:
+            job.error = f'{e}\n{traceback.format_exc()}'
+            job.status = 'failed'
+        finally:
+            job.finished = time.time()
+
+    async def _run_task(self, job, func, args, kwargs):
+        job.status = 'running'
+        job.started = time.time()
+        try:
+            job.result = await func(job, *args, **kwargs)
+            job.status = 'succeeded'
+        except asyncio.CancelledError:
+            # Cancelled with the event loop (e.g. at server shutdown); the task must still end cancelled
+            job.error = 'Cancelled'
+            job.status = 'cancelled'
+            raise
+        except Exception as e:
+            job.error = f'{e}\n{traceback.format_exc()}'
+            job.status = 'failed'
+        finally:
+            job.finished = time.time()
+
+    def _prune(self):
+        # Forget the oldest finished jobs once over the limit; running jobs are kept
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.done]:
+            if len(self.jobs) <= self.max_jobs:
+                break
+            del self.jobs[job_id]
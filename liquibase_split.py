@@ -1,77 +1,218 @@
 import xml.etree.ElementTree as ET
 import os
+import json
+import argparse
+from collections import OrderedDict
 
-def write_changelog(file_path, root_element):
-    # Remove the namespace prefixes
-    for elem in root_element.iter():
-        elem.tag = elem.tag.replace("{http://www.liquibase.org/xml/ns/dbchangelog}", "")
-        for key, value in elem.attrib.items():
-            if key.startswith("{http://www.liquibase.org/xml/ns/dbchangelog}"):
-                new_key = key.replace("{http://www.liquibase.org/xml/ns/dbchangelog}", "")
-                elem.attrib[new_key] = value
-                del elem.attrib[key]
-
-    # Create a new XML tree
-    tree = ET.ElementTree(root_element)
-    # Write the XML to the file
-    tree.write(file_path, encoding="utf-8", xml_declaration=True)
-    print(f"Created {file_path}")
-
-def split_changelog_by_table(input_file):
-    try:
-        tree = ET.parse(input_file)
-        root = tree.getroot()
-        namespace = {"ns": "http://www.liquibase.org/xml/ns/dbchangelog"}
+"""
+Liquibase Changelog Splitter
+============================
+
+Splits one (possibly very large) Liquibase XML changelog into a changelog per
+table plus a db.changelog-master.xml that includes them in first-seen order.
+The input is streamed with iterparse: each changeSet is routed and appended to
+its output file as soon as it has been parsed, then discarded, so memory use
+depends on the largest changeSet rather than the size of the changelog.
+
+A changeSet is routed by its first change whose type has a routing rule. A rule
+names the attribute holding the table name and, optionally, the output file
+pattern, so data changes can be kept apart from schema changes:
+
+   {"insert": {"attribute": "tableName", "file": "data/{table}.xml"},
+    "sql": null}
+
+Rules from --rules are merged over DEFAULT_ROUTING_RULES (null removes one).
+ChangeSets no rule matches go to --unrouted-file, and top-level elements other
+than changeSets (property, preConditions, include) are copied into the master.
+
+Example Commands:
+-----------------
+1. Split changelog.xml into ./output_tables:
+   python liquibase_split.py
+
+2. Split a generated changelog with data changes in their own files:
+   python liquibase_split.py generated.xml --output-dir split --rules routing.json
+"""
+
+LIQUIBASE_NS = "http://www.liquibase.org/xml/ns/dbchangelog"
+NS_PREFIX = f"{{{LIQUIBASE_NS}}}"
+CHANGELOG_HEADER = (
+    "<?xml version='1.0' encoding='utf-8'?>\n"
+    f'<databaseChangeLog xmlns="{LIQUIBASE_NS}" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+    f'xsi:schemaLocation="{LIQUIBASE_NS} {LIQUIBASE_NS}/dbchangelog-latest.xsd">\n'
+)
+CHANGELOG_FOOTER = "</databaseChangeLog>\n"
+MASTER_CHANGELOG = "db.changelog-master.xml"
+DEFAULT_FILE_PATTERN = "{table}.xml"
+DEFAULT_UNROUTED_FILE = "unrouted.xml"
+
+# Change type -> attribute holding the table it belongs to
+DEFAULT_ROUTING_RULES = {
+    "createTable": "tableName",
+    "addForeignKeyConstraint": "baseTableName",
+    "addUniqueConstraint": "tableName",
+    "addColumn": "tableName",
+    "createIndex": "tableName",
+    "addPrimaryKey": "tableName",
+    "addNotNullConstraint": "tableName",
+    "addDefaultValue": "tableName",
+    "modifyDataType": "tableName",
+    "renameColumn": "tableName",
+    "dropColumn": "tableName",
+    "insert": "tableName",
+    "update": "tableName",
+    "delete": "tableName",
+    "loadData": "tableName",
+    "loadUpdateData": "tableName",
+}
+
+# Output files kept open at once; others are closed and reopened for append
+MAX_OPEN_FILES = 128
+
+def normalize_routing_rules(rules):
+    """ Return {change type: (attribute, file pattern)}, dropping rules set to None """
+    normalized = {}
+    for change_type, rule in rules.items():
+        if rule is None:
+            continue
+        if isinstance(rule, str):
+            rule = {"attribute": rule}
+        normalized[change_type] = (rule["attribute"], rule.get("file", DEFAULT_FILE_PATTERN))
+    return normalized
 
+def load_routing_rules(rules_file=None):
+    rules = dict(DEFAULT_ROUTING_RULES)
+    if rules_file:
+        with open(rules_file) as f:
+            rules.update(json.load(f))
+    return normalize_routing_rules(rules)
+
+def strip_namespace(element):
+    # Output files declare the Liquibase namespace as the default one
+    for elem in element.iter():
+        if elem.tag.startswith(NS_PREFIX):
+            elem.tag = elem.tag[len(NS_PREFIX):]
+        for key in [key for key in elem.attrib if key.startswith(NS_PREFIX)]:
+            elem.attrib[key[len(NS_PREFIX):]] = elem.attrib.pop(key)
+    return element
+
+def serialize(element):
+    element.tail = None
+    return "    " + ET.tostring(element, encoding="unicode") + "\n"
+
+def route_change_set(change_set, rules):
+    """ Return the output file for a changeSet, or None when no rule matches """
+    for change in change_set:
+        if not isinstance(change.tag, str) or not change.tag.startswith(NS_PREFIX):
+            continue
+        rule = rules.get(change.tag[len(NS_PREFIX):])
+        if rule is None:
+            continue
+        attribute, file_pattern = rule
+        table_name = change.get(attribute)
+        if table_name:
+            return file_pattern.format(table=table_name)
+    return None
+
+class ChangelogWriters:
+    """ Incremental changelog writers, one per output file, with a bounded number of open handles """
+    def __init__(self, output_dir, max_open=MAX_OPEN_FILES):
+        self.output_dir = output_dir
+        self.max_open = max_open
+        self.files = []
+        self.counts = {}
+        self.handles = OrderedDict()
+
+    def write(self, relative_path, element):
+        self._handle(relative_path).write(serialize(element))
+        self.counts[relative_path] += 1
+
+    def _handle(self, relative_path):
+        handle = self.handles.pop(relative_path, None)
+        if handle is None:
+            if len(self.handles) >= self.max_open:
+                self.handles.popitem(last=False)[1].close()
+            file_path = os.path.join(self.output_dir, relative_path)
+            if relative_path in self.counts:
+                handle = open(file_path, "a", encoding="utf-8")
+            else:
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                handle = open(file_path, "w", encoding="utf-8")
+                handle.write(CHANGELOG_HEADER)
+                self.files.append(relative_path)
+                self.counts[relative_path] = 0
+        # Most recently used last, so the least recently used handle is closed first
+        self.handles[relative_path] = handle
+        return handle
+
+    def close(self):
+        for handle in self.handles.values():
+            handle.close()
+        self.handles.clear()
+        for relative_path in self.files:
+            file_path = os.path.join(self.output_dir, relative_path)
+            with open(file_path, "a", encoding="utf-8") as f:
+                f.write(CHANGELOG_FOOTER)
+            print(f"Created {file_path} ({self.counts[relative_path]} changeSets)")
+
+def write_master_changelog(output_dir, top_level_elements, files):
+    master_file = os.path.join(output_dir, MASTER_CHANGELOG)
+    with open(master_file, "w", encoding="utf-8") as f:
+        f.write(CHANGELOG_HEADER)
+        for element in top_level_elements:
+            f.write(serialize(element))
+        for relative_path in files:
+            f.write(serialize(ET.Element("include", file=relative_path.replace(os.sep, "/"))))
+        f.write(CHANGELOG_FOOTER)
+    print(f"Created {master_file}")
+    return master_file
+
+def split_changelog_by_table(input_file, output_dir="output_tables", rules=None, unrouted_file=DEFAULT_UNROUTED_FILE):
+    rules = rules if rules is not None else load_routing_rules()
+    writers = ChangelogWriters(output_dir)
+    top_level_elements = []
+    try:
         # Ensure output directory exists
-        output_dir = "output_tables"
         os.makedirs(output_dir, exist_ok=True)
 
-        table_change_sets = {}
-
-        for changeSet in root.findall('ns:changeSet', namespace):
-            for change in changeSet:
-                table_name = None
-                if change.tag == f"{{{namespace['ns']}}}createTable":
-                    table_name = change.get('tableName')
-                elif change.tag == f"{{{namespace['ns']}}}addForeignKeyConstraint":
-                    table_name = change.get('baseTableName')
-                elif change.tag == f"{{{namespace['ns']}}}addUniqueConstraint":
-                    table_name = change.get('tableName')
-
-                if table_name:
-                    if table_name not in table_change_sets:
-                        table_change_sets[table_name] = ET.Element("databaseChangeLog", xmlns="http://www.liquibase.org/xml/ns/dbchangelog",
-                                                                   attrib={
-                                                                       "xmlns:xsi": "http://www.w3.org/2001/XMLSchema-instance",
-                                                                       "xsi:schemaLocation": "http://www.liquibase.org/xml/ns/dbchangelog http://www.liquibase.org/xml/ns/dbchangelog/dbchangelog-latest.xsd"
-                                                                   })
-                    # Append the current changeSet to the respective table's root
-                    table_change_sets[table_name].append(changeSet)
-
-        # Write out each table's changeSets to their own file
-        for table_name, table_root in table_change_sets.items():
-            output_file = os.path.join(output_dir, f"{table_name}.xml")
-            write_changelog(output_file, table_root)
-
-        # Create the master changelog
-        master_changelog = ET.Element("databaseChangeLog", xmlns="http://www.liquibase.org/xml/ns/dbchangelog",
-                                      attrib={
-                                          "xmlns:xsi": "http://www.w3.org/2001/XMLSchema-instance",
-                                          "xsi:schemaLocation": "http://www.liquibase.org/xml/ns/dbchangelog http://www.liquibase.org/xml/ns/dbchangelog/dbchangelog-latest.xsd"
-                                      })
-
-        for table_name in table_change_sets.keys():
-            ET.SubElement(master_changelog, "include", file=f"{table_name}.xml")
-
-        output_file = os.path.join(output_dir, "db.changelog-master.xml")
-        write_changelog(output_file, master_changelog)
+        depth = 0
+        root = None
+        for event, elem in ET.iterparse(input_file, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = elem
+                depth += 1
+                continue
+            depth -= 1
+            if depth != 1:
+                continue
+            # A direct child of databaseChangeLog is complete: write it out and drop it
+            if elem.tag == f"{NS_PREFIX}changeSet":
+                relative_path = route_change_set(elem, rules) or unrouted_file
+                if relative_path:
+                    writers.write(relative_path, strip_namespace(elem))
+            else:
+                top_level_elements.append(strip_namespace(elem))
+            del root[:]
+
+        writers.close()
+        write_master_changelog(output_dir, top_level_elements, writers.files)
+        return writers.counts
 
     except ET.ParseError as e:
         print(f"Error parsing XML: {e}")
     except Exception as e:
         print(f"An error occurred: {e}")
+    finally:
+        for handle in writers.handles.values():
+            handle.close()
 
 if __name__ == "__main__":
-    input_file = "changelog.xml"
-    split_changelog_by_table(input_file)
+    parser = argparse.ArgumentParser(description='Split a Liquibase changelog into one changelog per table')
+    parser.add_argument('input_file', nargs='?', default='changelog.xml', help='Changelog to split (default: changelog.xml)')
+    parser.add_argument('--output-dir', type=str, default='output_tables', help='Directory for the split changelogs')
+    parser.add_argument('--rules', type=str, help='JSON file of routing rules merged over the defaults')
+    parser.add_argument('--unrouted-file', type=str, default=DEFAULT_UNROUTED_FILE,
+                        help="File for changeSets no rule matches ('' drops them)")
+    args = parser.parse_args()
+    split_changelog_by_table(args.input_file, args.output_dir, load_routing_rules(args.rules), args.unrouted_file)
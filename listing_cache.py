@@ -0,0 +1,100 @@
+import time
+import threading
+from collections import OrderedDict
+
+"""
+Listing Cache
+=============
+
+In-process cache for S3 listing results. Entries are keyed by a tuple that
+starts with (bucket, prefix), followed by whatever else identifies the result
+(for listings: the page cursor and page size). Entries expire after a TTL and
+the least recently used entry is evicted once the cache is full.
+
+Routes that change a prefix call invalidate_key() so that only the listings
+that can see the change are dropped: every ancestor prefix of the key (a new
+key can make an implicit folder appear in its parent) and, for folder-level
+operations, every listing inside the subtree.
+"""
+
+DEFAULT_TTL = 30
+DEFAULT_MAX_ENTRIES = 1024
+
+# Returned by get() on a miss, since None is a valid cached value
+MISSING = object()
+
+def ancestor_prefixes(key):
+    """ Return the listing prefixes a key appears under, e.g. 'a/b/c' -> ['', 'a/', 'a/b/'] """
+    parts = key.rstrip('/').split('/')[:-1]
+    return [''] + ['/'.join(parts[:i + 1]) + '/' for i in range(len(parts))]
+
+class ListingCache:
+    """ Thread-safe TTL + LRU cache with prefix-based invalidation """
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                self.misses += 1
+                return MISSING
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_prefix(self, bucket, prefix, recursive=False):
+        """ Drop every cached entry for a prefix (and everything below it if recursive) """
+        with self.lock:
+            stale = [
+                key for key in self.entries
+                if key[0] == bucket and (key[1] == prefix or (recursive and key[1].startswith(prefix)))
+            ]
+            for key in stale:
+                del self.entries[key]
+            self.invalidations += len(stale)
+
+    def invalidate_key(self, bucket, key, recursive=False):
+        """ Drop the listings affected by a change to `key` """
+        for prefix in ancestor_prefixes(key):
+            self.invalidate_prefix(bucket, prefix)
+        if recursive:
+            self.invalidate_prefix(bucket, key, recursive=True)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
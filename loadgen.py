@@ -0,0 +1,209 @@
+import sys
+import time
+import json
+import math
+import random
+import string
+import argparse
+import threading
+import contextlib
+import s3_bulk
+import s3_client
+from histogram import LatencyHistogram
+
+"""
+S3 Load Generator
+=================
+
+Writes a configurable number of objects under a prefix with concurrent
+put_object calls and reports throughput (ops/s, MB/s) and latency percentiles.
+Used by the web UI's "Generate Random Jibberish" form as a background job, and
+runnable headless against any S3-compatible endpoint.
+
+Example Commands:
+-----------------
+1. 10,000 objects of 4 KiB, 32 at a time, against a local MinIO:
+   python loadgen.py --endpoint-url http://localhost:9000 --bucket test --count 10000 --size 4KB --concurrency 32
+
+2. Log-normal sizes around 64 KiB spread over a 10-wide, 3-deep key tree:
+   python loadgen.py --bucket test --count 5000 --size-dist lognormal --size 64KB --fanout 10 --depth 3
+
+3. Same run against an in-process moto mock (requires moto):
+   python loadgen.py --moto --bucket test --count 1000
+"""
+
+SIZE_UNITS = {'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+SIZE_DISTRIBUTIONS = ('fixed', 'uniform', 'lognormal')
+
+JIBBERISH_CHARACTERS = string.ascii_letters + string.digits + string.punctuation + ' '
+# Payloads are slices of one pre-generated block so large runs don't spend their time in random()
+PAYLOAD_BLOCK_SIZE = 64 * 1024
+
+def parse_size(value):
+    """ Parse sizes such as '100', '4KB' or '1.5MB' into bytes """
+    value = str(value).strip().upper()
+    for unit in sorted(SIZE_UNITS, key=len, reverse=True):
+        if value.endswith(unit):
+            return int(float(value[:-len(unit)]) * SIZE_UNITS[unit])
+    return int(value)
+
+def generate_random_string(length=10, rng=random):
+    return ''.join(rng.choices(string.ascii_letters + string.digits, k=length))
+
+def generate_jibberish_content(length=100, rng=random):
+    return ''.join(rng.choices(JIBBERISH_CHARACTERS, k=length))
+
+class LoadSpec:
+    """ Parameters of a load-generation run """
+    def __init__(self, count=10, size=100, size_dist='fixed', max_size=None, fanout=5, depth=1,
+                 concurrency=8, folder_markers=True, seed=None):
+        if size_dist not in SIZE_DISTRIBUTIONS:
+            raise ValueError(f'Unknown size distribution: {size_dist}')
+        self.count = count
+        self.size = parse_size(size)
+        self.size_dist = size_dist
+        self.max_size = parse_size(max_size) if max_size else None
+        self.fanout = max(1, fanout)
+        self.depth = max(0, depth)
+        self.concurrency = max(1, concurrency)
+        self.folder_markers = folder_markers
+        self.seed = seed
+
+    def to_dict(self):
+        return dict(vars(self))
+
+    def object_size(self, rng):
+        if self.size_dist == 'uniform' and self.max_size:
+            return rng.randint(min(self.size, self.max_size), max(self.size, self.max_size))
+        if self.size_dist == 'lognormal':
+            # `size` is the median; sigma of 1 gives a long tail of larger objects
+            size = int(rng.lognormvariate(math.log(max(self.size, 1)), 1.0))
+            return min(size, self.max_size) if self.max_size else size
+        return self.size
+
+class LoadStats:
+    """ Thread-safe collection of per-operation results """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = LatencyHistogram()
+        self.bytes = 0
+        self.errors = 0
+        self.started = time.perf_counter()
+
+    def record(self, latency, size):
+        self.latencies.record(latency)
+        with self.lock:
+            self.bytes += size
+
+    def record_error(self):
+        with self.lock:
+            self.errors += 1
+
+    def summary(self):
+        latency = self.latencies.summary()
+        elapsed = time.perf_counter() - self.started
+        ops = latency.pop('count')
+        with self.lock:
+            return {
+                'ops': ops,
+                'errors': self.errors,
+                'bytes': self.bytes,
+                'elapsed_s': round(elapsed, 3),
+                'ops_per_s': round(ops / elapsed, 2) if elapsed else 0.0,
+                'mb_per_s': round(self.bytes / (1024 ** 2) / elapsed, 3) if elapsed else 0.0,
+                'latency_ms': latency,
+            }
+
+def make_payload(block, size):
+    """ `size` bytes cut from (repeats of) a pre-generated block """
+    if size > len(block):
+        return (block * (size // len(block) + 1))[:size]
+    return block[:size]
+
+def plan_objects(prefix, spec):
+    """ Yield (key, size) for every object of the run, folder markers first """
+    rng = random.Random(spec.seed)
+    folders = [prefix]
+    for _ in range(spec.depth):
+        folders = [f'{parent}{generate_random_string(rng=rng)}/' for parent in folders for _ in range(spec.fanout)]
+        if len(folders) > spec.count:
+            folders = folders[:spec.count]
+    if spec.folder_markers and spec.depth:
+        for folder in folders:
+            yield folder, 0
+    for i in range(spec.count):
+        folder = folders[i % len(folders)]
+        yield f'{folder}{generate_random_string(rng=rng)}.txt', spec.object_size(rng)
+
+def run_load(s3, bucket, prefix, spec, job=None):
+    """ Write the planned objects with `spec.concurrency` workers and return the run summary """
+    block = generate_jibberish_content(PAYLOAD_BLOCK_SIZE, random.Random(spec.seed)).encode()
+    stats = LoadStats()
+
+    def put(task):
+        key, size = task
+        body = make_payload(block, size)
+        started = time.perf_counter()
+        try:
+            s3.put_object(Bucket=bucket, Key=key, Body=body)
+        except Exception as e:
+            stats.record_error()
+            return 0, [{'Key': key, 'Code': type(e).__name__, 'Message': str(e)}]
+        stats.record(time.perf_counter() - started, size)
+        return 1, []
+
+    def progress(result):
+        if job is not None and result.total % 100 == 0:
+            job.progress = stats.summary()
+
+    result = s3_bulk.run_batches(plan_objects(prefix, spec), put, spec.concurrency, progress)
+    summary = stats.summary()
+    summary['spec'] = spec.to_dict()
+    summary['sample_errors'] = result.errors[:10]
+    if job is not None:
+        job.progress = summary
+    return summary
+
+@contextlib.contextmanager
+def open_client(endpoint_url=None, bucket=None, concurrency=None, moto=False):
+    """ Yield (s3, bucket) for a CLI run, optionally inside an in-process moto mock """
+    settings = s3_client.load_settings()
+    bucket = bucket or settings['bucket_name']
+    overrides = {'max_pool_connections': max(settings['max_pool_connections'], concurrency or 0)}
+    if endpoint_url:
+        overrides['endpoint_url'] = endpoint_url
+    if not moto:
+        yield s3_client.create_client(settings, **overrides), bucket
+        return
+    from moto import mock_aws
+    with mock_aws():
+        overrides.update(endpoint_url='', region_name='us-east-1')
+        s3 = s3_client.create_client(settings, **overrides)
+        s3.create_bucket(Bucket=bucket)
+        yield s3, bucket
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Concurrent S3 load generator')
+    parser.add_argument('--endpoint-url', type=str, help='S3 endpoint (defaults to config.json / S3_ENDPOINT_URL)')
+    parser.add_argument('--bucket', type=str, help='Bucket to write to (defaults to config.json / S3_BUCKET)')
+    parser.add_argument('--prefix', type=str, default='loadgen/', help='Key prefix for generated objects')
+    parser.add_argument('--count', type=int, default=1000, help='Number of objects to write')
+    parser.add_argument('--size', type=str, default='100', help='Object size, or median for lognormal (e.g. 4KB)')
+    parser.add_argument('--size-dist', choices=SIZE_DISTRIBUTIONS, default='fixed', help='Object size distribution')
+    parser.add_argument('--max-size', type=str, help='Upper bound for the uniform distribution')
+    parser.add_argument('--fanout', type=int, default=5, help='Folders per level of the key tree')
+    parser.add_argument('--depth', type=int, default=1, help='Levels of folders in the key tree')
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent put_object calls')
+    parser.add_argument('--seed', type=int, help='Random seed for reproducible key names and sizes')
+    parser.add_argument('--moto', action='store_true', help='Run against an in-process moto mock')
+    args = parser.parse_args(argv)
+
+    spec = LoadSpec(args.count, args.size, args.size_dist, args.max_size, args.fanout, args.depth,
+                    args.concurrency, seed=args.seed)
+    with open_client(args.endpoint_url, args.bucket, spec.concurrency, args.moto) as (s3, bucket):
+        summary = run_load(s3, bucket, args.prefix, spec)
+    json.dump(summary, sys.stdout, indent=2)
+    print()
+
+if __name__ == '__main__':
+    main()
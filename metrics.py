@@ -0,0 +1,256 @@
+import time
+import threading
+from flask import g, request, has_request_context, before_render_template, template_rendered
+
+"""
+Request and S3 Instrumentation
+==============================
+
+Collects per-route and per-S3-operation metrics for the Flask browser and
+renders them in the Prometheus text exposition format.
+
+   instrument_client(s3, registry)   botocore before-call/after-call hooks:
+                                     count, latency, bytes sent/received,
+                                     retries and error codes per operation
+   instrument_app(app, registry)     Flask before/after-request hooks and
+                                     template signals: count, latency and
+                                     render time per route, plus an optional
+                                     slow-request log that breaks a request
+                                     down into its S3 calls
+   instrument_asgi_app(app, registry)
+                                     the same for the Quart app (async_app.py),
+                                     without template render time
+
+S3 calls made from worker pools (bulk deletes, uploads, jobs) are counted per
+operation but only calls made on the request thread (or, in the Quart app,
+awaited by the request itself) appear in the slow log.
+"""
+
+# Histogram buckets (seconds) shared by route and S3 latencies
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class MetricsRegistry:
+    """ Thread-safe counters and fixed-bucket histograms with Prometheus text output """
+    def __init__(self, namespace='s3browser', buckets=LATENCY_BUCKETS):
+        self.namespace = namespace
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.help = {}
+        self.counters = {}
+        self.histograms = {}
+
+    def describe(self, name, help_text):
+        self.help[name] = help_text
+
+    def inc(self, name, labels=None, value=1):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=None):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def render(self, gauges=None):
+        """ Render every metric, plus optional {name: value} gauges, in Prometheus text format """
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+        seen = set()
+        for (name, labels), value in counters:
+            full_name = f'{self.namespace}_{name}'
+            if name not in seen:
+                lines.extend(self._header(name, full_name, 'counter'))
+                seen.add(name)
+            lines.append(f'{full_name}{_format_labels(labels)} {value}')
+        for (name, labels), histogram in histograms:
+            full_name = f'{self.namespace}_{name}'
+            if name not in seen:
+                lines.extend(self._header(name, full_name, 'histogram'))
+                seen.add(name)
+            # Bucket counts are already cumulative: observe() increments every bucket >= value
+            for bound, count in zip(self.buckets, histogram['buckets']):
+                lines.append(f'{full_name}_bucket{_format_labels(labels + (("le", str(bound)),))} {count}')
+            lines.append(f'{full_name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {histogram["count"]}')
+            lines.append(f'{full_name}_sum{_format_labels(labels)} {histogram["sum"]}')
+            lines.append(f'{full_name}_count{_format_labels(labels)} {histogram["count"]}')
+        for name, value in sorted((gauges or {}).items()):
+            full_name = f'{self.namespace}_{name}'
+            lines.extend(self._header(name, full_name, 'gauge'))
+            lines.append(f'{full_name} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def _header(self, name, full_name, metric_type):
+        lines = []
+        if name in self.help:
+            lines.append(f'# HELP {full_name} {self.help[name]}')
+        lines.append(f'# TYPE {full_name} {metric_type}')
+        return lines
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+def _body_size(body):
+    if isinstance(body, (bytes, bytearray)):
+        return len(body)
+    if isinstance(body, str):
+        return len(body.encode('utf-8'))
+    return 0
+
+def flask_request_calls():
+    """ The S3 call list of the current Flask request, or None outside a timed request """
+    if has_request_context() and 'metrics_s3_calls' in g:
+        return g.metrics_s3_calls
+    return None
+
+def asgi_request_calls():
+    """ The S3 call list of the current Quart request (async_app.py), or None outside a timed request """
+    from quart import g as asgi_g, has_request_context as has_asgi_request_context
+    if has_asgi_request_context() and 'metrics_s3_calls' in asgi_g:
+        return asgi_g.metrics_s3_calls
+    return None
+
+def instrument_client(s3, registry, request_calls=flask_request_calls):
+    """ Record count, latency, bytes, retries and errors for every call made by an S3 client
+
+    Calls are also appended to the list request_calls() returns, for the slow-request log.
+    """
+    registry.describe('s3_requests_total', 'S3 API calls by operation and HTTP status.')
+    registry.describe('s3_request_duration_seconds', 'S3 API call latency including retries.')
+    registry.describe('s3_bytes_sent_total', 'Request body bytes sent to S3.')
+    registry.describe('s3_bytes_received_total', 'Response body bytes received from S3.')
+    registry.describe('s3_retries_total', 'Retry attempts made by botocore.')
+    registry.describe('s3_errors_total', 'S3 API calls that returned an error, by error code.')
+
+    def before_call(model, params, context, **kwargs):
+        context['metrics_started'] = time.perf_counter()
+        # after-call-error is emitted without the operation model
+        context['metrics_operation'] = model.name
+        context['metrics_bytes_sent'] = _body_size(params.get('body'))
+
+    def after_call(http_response, parsed, model, context, **kwargs):
+        started = context.get('metrics_started')
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        operation = model.name
+        metadata = parsed.get('ResponseMetadata', {})
+        status = metadata.get('HTTPStatusCode', getattr(http_response, 'status_code', 0))
+        received = int(metadata.get('HTTPHeaders', {}).get('content-length', 0) or 0)
+        labels = {'operation': operation}
+        registry.inc('s3_requests_total', {'operation': operation, 'status': str(status)})
+        registry.observe('s3_request_duration_seconds', elapsed, labels)
+        registry.inc('s3_bytes_sent_total', labels, context.get('metrics_bytes_sent', 0))
+        registry.inc('s3_bytes_received_total', labels, received)
+        if metadata.get('RetryAttempts'):
+            registry.inc('s3_retries_total', labels, metadata['RetryAttempts'])
+        if 'Error' in parsed:
+            registry.inc('s3_errors_total', {'operation': operation, 'code': parsed['Error'].get('Code', '')})
+        calls = request_calls()
+        if calls is not None:
+            calls.append((operation, elapsed, status))
+
+    def after_call_error(exception, context, **kwargs):
+        started = context.get('metrics_started')
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        operation = context.get('metrics_operation', '')
+        registry.observe('s3_request_duration_seconds', elapsed, {'operation': operation})
+        registry.inc('s3_errors_total', {'operation': operation, 'code': type(exception).__name__})
+        calls = request_calls()
+        if calls is not None:
+            calls.append((operation, elapsed, type(exception).__name__))
+
+    events = s3.meta.events
+    events.register('before-call.s3', before_call)
+    events.register('after-call.s3', after_call)
+    events.register('after-call-error.s3', after_call_error)
+    return s3
+
+def record_request(registry, request, response, started, calls=(), render_time=0.0, slow_request_threshold=None, logger=None):
+    """ Count and time one finished request; log it with its S3 breakdown when slower than the threshold """
+    elapsed = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    registry.inc('http_requests_total', {'route': route, 'method': request.method, 'status': str(response.status_code)})
+    registry.observe('http_request_duration_seconds', elapsed, {'route': route})
+    if slow_request_threshold is not None and elapsed >= slow_request_threshold and logger is not None:
+        s3_time = sum(call[1] for call in calls)
+        breakdown = ', '.join(f'{op}={latency * 1000:.1f}ms ({status})' for op, latency, status in calls)
+        logger.warning(
+            f'Slow request {request.method} {request.path}: {elapsed * 1000:.1f}ms total, '
+            f'{len(calls)} S3 calls {s3_time * 1000:.1f}ms, template {render_time * 1000:.1f}ms, '
+            f'other {(elapsed - s3_time - render_time) * 1000:.1f}ms [{breakdown}]'
+        )
+
+def instrument_app(app, registry, slow_request_threshold=None):
+    """ Record per-route metrics; log requests slower than the threshold (seconds) with their S3 breakdown """
+    registry.describe('http_requests_total', 'HTTP requests by route, method and status.')
+    registry.describe('http_request_duration_seconds', 'Time spent handling a request (excluding streamed bodies).')
+    registry.describe('template_render_duration_seconds', 'Jinja template render time by template.')
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+        g.metrics_s3_calls = []
+        g.metrics_render_time = 0.0
+
+    @app.after_request
+    def after_request(response):
+        started = g.get('metrics_started')
+        if started is not None:
+            record_request(registry, request, response, started, g.pop('metrics_s3_calls', []),
+                           g.get('metrics_render_time', 0.0), slow_request_threshold, app.logger)
+        return response
+
+    def render_started(sender, template, context, **extra):
+        g.metrics_render_started = time.perf_counter()
+
+    def render_finished(sender, template, context, **extra):
+        started = g.pop('metrics_render_started', None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        g.metrics_render_time = g.get('metrics_render_time', 0.0) + elapsed
+        registry.observe('template_render_duration_seconds', elapsed, {'template': template.name or ''})
+
+    before_render_template.connect(render_started, app)
+    template_rendered.connect(render_finished, app)
+    return app
+
+def instrument_asgi_app(app, registry, slow_request_threshold=None):
+    """ instrument_app for the Quart app (async_app.py), without template render timing
+
+    Pair it with instrument_client(s3, registry, asgi_request_calls).
+    """
+    from quart import g as asgi_g, request as asgi_request
+    registry.describe('http_requests_total', 'HTTP requests by route, method and status.')
+    registry.describe('http_request_duration_seconds', 'Time spent handling a request (excluding streamed bodies).')
+
+    @app.before_request
+    async def start_timer():
+        asgi_g.metrics_started = time.perf_counter()
+        asgi_g.metrics_s3_calls = []
+
+    @app.after_request
+    async def after_request(response):
+        started = asgi_g.get('metrics_started')
+        if started is not None:
+            # Popped so jobs started by this request, which inherit its context, stop recording into it
+            record_request(registry, asgi_request, response, started, asgi_g.pop('metrics_s3_calls', []),
+                           0.0, slow_request_threshold, app.logger)
+        return response
+
+    return app
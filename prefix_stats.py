@@ -0,0 +1,320 @@
+import io
+import csv
+import gzip
+import json
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from urllib.parse import unquote_plus
+from concurrent.futures import ThreadPoolExecutor
+from listing_cache import MISSING
+
+"""
+Prefix Statistics
+=================
+
+Object count, total bytes, oldest/newest modification and a storage-class
+breakdown for a prefix and each of its sub-folders.
+
+Live statistics are gathered by expanding the folder tree `split_depth` levels
+deep with delimiter listings, one level at a time across a worker pool, then
+flat-listing every folder at the bottom level in parallel. Subtree results are
+stored per prefix in a ListingCache, so after a change only the subtrees on
+the changed key's path (the ones invalidate_key() drops) are listed again and
+everything else is reused.
+
+For buckets too large to list live, the same summary can be built from an S3
+Inventory report: the manifest.json names the CSV (gzip) or Parquet files,
+which are streamed and aggregated in parallel. Parquet needs pyarrow.
+Versioned inventories count noncurrent versions too; delete markers are skipped.
+"""
+
+DEFAULT_WORKERS = 16
+# Levels below the requested prefix that are expanded before flat-listing
+DEFAULT_SPLIT_DEPTH = 2
+DEFAULT_STORAGE_CLASS = 'STANDARD'
+
+def parse_timestamp(value):
+    """ Inventory timestamps as aware datetimes ('2024-01-31T12:00:00.000Z' or datetime) """
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+class PrefixStats:
+    """ Aggregate of a set of objects """
+    def __init__(self):
+        self.count = 0
+        self.bytes = 0
+        self.oldest = None
+        self.newest = None
+        self.storage_classes = {}
+
+    def add(self, size, modified=None, storage_class=None):
+        self.count += 1
+        self.bytes += size
+        if modified is not None:
+            if self.oldest is None or modified < self.oldest:
+                self.oldest = modified
+            if self.newest is None or modified > self.newest:
+                self.newest = modified
+        by_class = self.storage_classes.setdefault(storage_class or DEFAULT_STORAGE_CLASS, [0, 0])
+        by_class[0] += 1
+        by_class[1] += size
+
+    def add_object(self, obj):
+        """ Add a list_objects_v2 Contents entry """
+        self.add(obj['Size'], obj.get('LastModified'), obj.get('StorageClass'))
+
+    def merge(self, other):
+        self.count += other.count
+        self.bytes += other.bytes
+        if other.oldest is not None and (self.oldest is None or other.oldest < self.oldest):
+            self.oldest = other.oldest
+        if other.newest is not None and (self.newest is None or other.newest > self.newest):
+            self.newest = other.newest
+        for storage_class, (count, size) in other.storage_classes.items():
+            by_class = self.storage_classes.setdefault(storage_class, [0, 0])
+            by_class[0] += count
+            by_class[1] += size
+        return self
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'bytes': self.bytes,
+            'oldest': self.oldest.isoformat() if self.oldest else None,
+            'newest': self.newest.isoformat() if self.newest else None,
+            'storage_classes': {
+                storage_class: {'count': count, 'bytes': size}
+                for storage_class, (count, size) in sorted(self.storage_classes.items())
+            },
+        }
+
+def list_level(s3, bucket, prefix):
+    """ One delimiter listing: (stats of the objects directly under prefix, child prefixes) """
+    direct = PrefixStats()
+    children = []
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter='/'):
+        for obj in page.get('Contents', []):
+            direct.add_object(obj)
+        children.extend(cp['Prefix'] for cp in page.get('CommonPrefixes', []))
+    return direct, children
+
+def list_subtree(s3, bucket, prefix):
+    """ Stats of every object under prefix, from one flat listing """
+    stats = PrefixStats()
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            stats.add_object(obj)
+    return stats
+
+def summary(prefix, source, files, children, **extra):
+    total = PrefixStats().merge(files)
+    for stats in children.values():
+        total.merge(stats)
+    return {
+        'prefix': prefix,
+        'source': source,
+        'computed': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'total': total.to_dict(),
+        'files': files.to_dict(),
+        'children': {child: stats.to_dict() for child, stats in sorted(children.items())},
+        **extra,
+    }
+
+class StatsWalk:
+    """ Level-by-level plan of a live statistics walk, independent of how the listings run
+
+    levels() yields (depth, prefixes to list, flat) one level at a time; the caller
+    lists them (list_level, or list_subtree when `flat`) and hands the results to
+    add_levels()/add_subtrees() before asking for the next level. Subtrees cached
+    under (bucket, prefix, 'stats') are reused below the requested prefix.
+    """
+    def __init__(self, bucket, prefix, cache=None, split_depth=DEFAULT_SPLIT_DEPTH):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.cache = cache
+        # The requested prefix is always expanded so its children can be reported
+        self.split_depth = max(1, split_depth)
+        self.nodes = {}
+        self.subtrees = {}
+        self.computed = []
+        self.listed = 0
+        self.reused = 0
+
+    def cached(self, node):
+        if self.cache is None:
+            return MISSING
+        return self.cache.get((self.bucket, node, 'stats'))
+
+    def levels(self):
+        level = [self.prefix]
+        for depth in range(self.split_depth + 1):
+            pending = []
+            for node in level:
+                stats = self.cached(node) if depth else MISSING
+                if stats is MISSING:
+                    pending.append(node)
+                else:
+                    self.subtrees[node] = stats
+                    self.reused += 1
+            flat = depth == self.split_depth
+            yield depth, pending, flat
+            if flat:
+                return
+            level = [child for node in pending for child in self.nodes[node][1]]
+
+    def add_levels(self, pending, results):
+        """ Record the list_level() results of one level """
+        for node, (direct, children) in zip(pending, results):
+            self.nodes[node] = (direct, children)
+        self.computed.extend(pending)
+        self.listed += len(pending)
+
+    def add_subtrees(self, pending, results):
+        """ Record the list_subtree() results of the bottom level """
+        for node, stats in zip(pending, results):
+            self.subtrees[node] = stats
+        self.computed.extend(pending)
+        self.listed += len(pending)
+
+    def progress(self, depth):
+        return {'listed_prefixes': self.listed, 'reused_prefixes': self.reused, 'depth': depth}
+
+    def summary(self):
+        """ Aggregate bottom-up, cache every listed subtree and return the prefix summary """
+        # Children are always longer than their parent, so this aggregates bottom-up
+        for node in sorted(self.nodes, key=len, reverse=True):
+            direct, children = self.nodes[node]
+            self.subtrees[node] = PrefixStats().merge(direct)
+            for child in children:
+                self.subtrees[node].merge(self.subtrees[child])
+        if self.cache is not None:
+            for node in self.computed:
+                self.cache.put((self.bucket, node, 'stats'), self.subtrees[node])
+
+        direct, children = self.nodes[self.prefix]
+        return summary(self.prefix, 'live', direct, {child: self.subtrees[child] for child in children},
+                       listed_prefixes=self.listed, reused_prefixes=self.reused)
+
+def compute_stats(s3, bucket, prefix, cache=None, workers=DEFAULT_WORKERS, split_depth=DEFAULT_SPLIT_DEPTH, progress=None):
+    """ Live statistics for prefix and each of its sub-folders, reusing cached subtrees
+
+    Every subtree listed here is put in `cache` under (bucket, prefix, 'stats').
+    """
+    walk = StatsWalk(bucket, prefix, cache, split_depth)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for depth, pending, flat in walk.levels():
+            if flat:
+                walk.add_subtrees(pending, pool.map(lambda node: list_subtree(s3, bucket, node), pending))
+                break
+            walk.add_levels(pending, pool.map(lambda node: list_level(s3, bucket, node), pending))
+            if progress:
+                progress(walk.progress(depth))
+    return walk.summary()
+
+def parse_s3_url(url, default_bucket):
+    """ 's3://bucket/key' -> (bucket, key); a bare key is taken from default_bucket """
+    if url.startswith('s3://'):
+        bucket, _, key = url[len('s3://'):].partition('/')
+        return bucket, key
+    return default_bucket, url
+
+class InventoryAggregate:
+    """ Objects under a prefix from inventory rows, split into direct files and first-level children """
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.files = PrefixStats()
+        self.children = {}
+
+    def add(self, key, size, modified, storage_class):
+        if not key.startswith(self.prefix):
+            return
+        rest = key[len(self.prefix):]
+        if '/' in rest:
+            child = self.prefix + rest.split('/', 1)[0] + '/'
+            stats = self.children.get(child)
+            if stats is None:
+                stats = self.children[child] = PrefixStats()
+        else:
+            stats = self.files
+        stats.add(size, modified, storage_class)
+
+    def merge(self, other):
+        self.files.merge(other.files)
+        for child, stats in other.children.items():
+            self.children.setdefault(child, PrefixStats()).merge(stats)
+        return self
+
+def read_inventory_csv(body, fields, aggregate):
+    columns = {name: i for i, name in enumerate(fields)}
+    size_column = columns['Size']
+    modified_column = columns.get('LastModifiedDate')
+    class_column = columns.get('StorageClass')
+    marker_column = columns.get('IsDeleteMarker')
+    with gzip.GzipFile(fileobj=body) as raw:
+        for row in csv.reader(io.TextIOWrapper(raw, encoding='utf-8', newline='')):
+            if marker_column is not None and row[marker_column] == 'true':
+                continue
+            if not row[size_column]:
+                continue
+            aggregate.add(
+                unquote_plus(row[columns['Key']]),
+                int(row[size_column]),
+                parse_timestamp(row[modified_column]) if modified_column is not None else None,
+                row[class_column] if class_column is not None else None,
+            )
+
+def read_inventory_parquet(body, aggregate):
+    import pyarrow.parquet
+    # Parquet needs random access, so spool the file to disk first
+    with tempfile.TemporaryFile() as spool:
+        shutil.copyfileobj(body, spool, 1024 * 1024)
+        spool.seek(0)
+        parquet_file = pyarrow.parquet.ParquetFile(spool)
+        available = set(parquet_file.schema_arrow.names)
+        columns = [name for name in ('key', 'size', 'last_modified_date', 'storage_class', 'is_delete_marker') if name in available]
+        for batch in parquet_file.iter_batches(columns=columns):
+            for row in batch.to_pylist():
+                if row.get('is_delete_marker') or row.get('size') is None:
+                    continue
+                aggregate.add(row['key'], row['size'], parse_timestamp(row.get('last_modified_date')), row.get('storage_class'))
+
+def load_inventory_stats(s3, manifest_url, prefix, default_bucket, workers=DEFAULT_WORKERS, progress=None):
+    """ Statistics for prefix and its sub-folders from an S3 Inventory manifest.json """
+    manifest_bucket, manifest_key = parse_s3_url(manifest_url, default_bucket)
+    manifest = json.loads(s3.get_object(Bucket=manifest_bucket, Key=manifest_key)['Body'].read())
+    file_format = manifest.get('fileFormat', 'CSV').upper()
+    if file_format not in ('CSV', 'PARQUET'):
+        raise ValueError(f'Unsupported inventory format: {file_format}')
+    fields = [field.strip() for field in manifest.get('fileSchema', '').split(',')]
+    data_bucket = manifest.get('destinationBucket', '').split(':::')[-1] or manifest_bucket
+    files = manifest.get('files', [])
+
+    def read(inventory_file):
+        aggregate = InventoryAggregate(prefix)
+        body = s3.get_object(Bucket=data_bucket, Key=inventory_file['key'])['Body']
+        try:
+            if file_format == 'CSV':
+                read_inventory_csv(body, fields, aggregate)
+            else:
+                read_inventory_parquet(body, aggregate)
+        finally:
+            body.close()
+        return aggregate
+
+    result = InventoryAggregate(prefix)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for done, aggregate in enumerate(pool.map(read, files), 1):
+            result.merge(aggregate)
+            if progress:
+                progress({'inventory_files': len(files), 'inventory_files_read': done})
+
+    created = manifest.get('creationTimestamp')
+    return summary(prefix, 'inventory', result.files, result.children,
+                   inventory_manifest=f's3://{manifest_bucket}/{manifest_key}',
+                   inventory_date=datetime.fromtimestamp(int(created) / 1000, timezone.utc).isoformat() if created else None)
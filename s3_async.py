@@ -0,0 +1,305 @@
+import math
+import time
+import random
+import asyncio
+import s3_bulk
+import s3_transfer
+import loadgen
+import prefix_stats
+
+"""
+Async S3 Operations
+===================
+
+aiobotocore counterparts of the s3_bulk, s3_transfer, prefix_stats and loadgen
+helpers, used by the ASGI app (async_app.py). Results have the same shapes as
+the threaded versions (BulkResult, prefix summaries, load summaries).
+
+Fan-out goes through run_bounded(): a fixed set of worker coroutines pull items
+from a bounded queue, so at most `concurrency` S3 requests are in flight per
+operation and listings of any size are consumed page by page instead of being
+turned into one task per key.
+"""
+
+DEFAULT_CONCURRENCY = 32
+
+async def _aiter(items):
+    if hasattr(items, '__aiter__'):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+async def run_bounded(items, handler, concurrency=DEFAULT_CONCURRENCY, progress=None, backlog=None):
+    """ Await handler(item) -> (succeeded, errors) for every item of a (async) iterable
+
+    At most `concurrency` handlers run at once and at most `backlog` items
+    (default: two per worker) are read ahead of them.
+    """
+    result = s3_bulk.BulkResult()
+    queue = asyncio.Queue(maxsize=backlog or concurrency * 2)
+    finished = object()
+
+    async def produce():
+        async for item in _aiter(items):
+            await queue.put(item)
+        for _ in range(concurrency):
+            await queue.put(finished)
+
+    async def work():
+        while True:
+            item = await queue.get()
+            if item is finished:
+                return
+            succeeded, errors = await handler(item)
+            result.succeeded += succeeded
+            result.errors.extend(errors)
+            if progress:
+                progress(result)
+
+    tasks = [asyncio.create_task(produce())] + [asyncio.create_task(work()) for _ in range(concurrency)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # A failing handler stops the whole operation, including the producer
+        for task in tasks:
+            task.cancel()
+    return result
+
+async def bounded_map(func, items, concurrency=DEFAULT_CONCURRENCY):
+    """ [await func(item) for item in items], in order, at most `concurrency` at a time """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(item):
+        async with semaphore:
+            return await func(item)
+
+    return await asyncio.gather(*(run(item) for item in items))
+
+async def iter_objects(s3, bucket, prefix):
+    """ Yield the list_objects_v2 entry of every object under a prefix """
+    paginator = s3.get_paginator('list_objects_v2')
+    async for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            yield obj
+
+async def iter_keys(s3, bucket, prefix):
+    async for obj in iter_objects(s3, bucket, prefix):
+        yield obj['Key']
+
+async def iter_batches(items, size):
+    """ Group an (async) iterable into lists of at most `size` items """
+    batch = []
+    async for item in _aiter(items):
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+async def delete_batch(s3, bucket, keys):
+    """ Delete up to 1000 keys with a single DeleteObjects call """
+    try:
+        response = await s3.delete_objects(
+            Bucket=bucket,
+            Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True}
+        )
+    except Exception as e:
+        return 0, [{'Key': key, 'Code': type(e).__name__, 'Message': str(e)} for key in keys]
+    errors = response.get('Errors', [])
+    return len(keys) - len(errors), errors
+
+async def delete_keys(s3, bucket, keys, concurrency=s3_bulk.DEFAULT_WORKERS, progress=None):
+    batches = iter_batches(keys, s3_bulk.DELETE_BATCH_SIZE)
+    return await run_bounded(batches, lambda batch: delete_batch(s3, bucket, batch), concurrency, progress)
+
+async def delete_prefix(s3, bucket, prefix, concurrency=s3_bulk.DEFAULT_WORKERS, progress=None):
+    return await delete_keys(s3, bucket, iter_keys(s3, bucket, prefix), concurrency, progress)
+
+async def upload_stream(s3, bucket, key, stream, size=None, threshold=s3_transfer.MULTIPART_THRESHOLD,
+                        part_size=s3_transfer.PART_SIZE, concurrency=s3_transfer.DEFAULT_WORKERS, **extra):
+    """ Upload a readable (blocking) stream, switching to multipart above the threshold """
+    # Reads happen off the event loop; uploads are spooled to disk by the server
+    head = await asyncio.to_thread(s3_transfer.read_up_to, stream, threshold)
+    if len(head) < threshold:
+        return await s3.put_object(Bucket=bucket, Key=key, Body=head, **extra)
+    part_size = s3_transfer.choose_part_size(size, part_size)
+    upload_id = (await s3.create_multipart_upload(Bucket=bucket, Key=key, **extra))['UploadId']
+    parts = []
+
+    async def iter_parts():
+        pending = head
+        part_number = 0
+        while True:
+            if len(pending) < part_size:
+                pending += await asyncio.to_thread(s3_transfer.read_up_to, stream, part_size - len(pending))
+            if not pending:
+                return
+            part_number += 1
+            if part_number > s3_transfer.MAX_PARTS:
+                raise ValueError(f'Upload of {key} exceeds {s3_transfer.MAX_PARTS} parts; increase the part size')
+            yield part_number, pending[:part_size]
+            pending = pending[part_size:]
+
+    async def upload_part(part):
+        part_number, data = part
+        response = await s3.upload_part(Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=part_number, Body=data)
+        parts.append({'PartNumber': part_number, 'ETag': response['ETag']})
+        return 1, []
+
+    try:
+        # Only one part is read ahead of the uploads, as in MultipartUploader
+        await run_bounded(iter_parts(), upload_part, concurrency, backlog=1)
+        parts.sort(key=lambda part: part['PartNumber'])
+        return await s3.complete_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id, MultipartUpload={'Parts': parts})
+    except BaseException:
+        await s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+
+async def presign_multipart_upload(s3, bucket, key, size, part_size=s3_transfer.PART_SIZE, expires_in=3600):
+    """ Start a multipart upload and presign one upload_part URL per part for the browser """
+    part_size = s3_transfer.choose_part_size(size, part_size)
+    part_count = max(1, math.ceil(size / part_size))
+    upload_id = (await s3.create_multipart_upload(Bucket=bucket, Key=key))['UploadId']
+    urls = [
+        await s3.generate_presigned_url(
+            'upload_part',
+            Params={'Bucket': bucket, 'Key': key, 'UploadId': upload_id, 'PartNumber': part_number},
+            ExpiresIn=expires_in
+        )
+        for part_number in range(1, part_count + 1)
+    ]
+    return {'key': key, 'upload_id': upload_id, 'part_size': part_size, 'urls': urls}
+
+async def complete_presigned_upload(s3, bucket, key, upload_id, parts):
+    parts = sorted(
+        ({'PartNumber': int(part['PartNumber']), 'ETag': part['ETag']} for part in parts),
+        key=lambda part: part['PartNumber']
+    )
+    return await s3.complete_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id, MultipartUpload={'Parts': parts})
+
+async def copy_object(s3, bucket, source_key, dest_key, size=None, source_bucket=None,
+                      part_size=s3_transfer.COPY_PART_SIZE, concurrency=s3_transfer.DEFAULT_WORKERS, **extra):
+    """ Copy one object inside S3, with a multipart copy above MAX_COPY_OBJECT_SIZE """
+    source = {'Bucket': source_bucket or bucket, 'Key': source_key}
+    if size is None or size > s3_transfer.MAX_COPY_OBJECT_SIZE:
+        head = await s3.head_object(**source)
+        if head['ContentLength'] > s3_transfer.MAX_COPY_OBJECT_SIZE:
+            return await multipart_copy(s3, bucket, source, dest_key, head, part_size, concurrency)
+    return await s3.copy_object(Bucket=bucket, Key=dest_key, CopySource=source, **extra)
+
+async def multipart_copy(s3, bucket, source, dest_key, head, part_size=s3_transfer.COPY_PART_SIZE,
+                         concurrency=s3_transfer.DEFAULT_WORKERS):
+    size = head['ContentLength']
+    part_size = s3_transfer.choose_part_size(size, part_size)
+    extra = {name: head[name] for name in s3_transfer.COPIED_HEADERS if head.get(name)}
+    tag_set = (await s3.get_object_tagging(**source))['TagSet']
+    if tag_set:
+        extra['Tagging'] = s3_transfer.tagging_header(tag_set)
+    upload_id = (await s3.create_multipart_upload(Bucket=bucket, Key=dest_key, **extra))['UploadId']
+
+    async def copy_part(part_number):
+        start = (part_number - 1) * part_size
+        end = min(start + part_size, size) - 1
+        response = await s3.upload_part_copy(
+            Bucket=bucket,
+            Key=dest_key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            CopySource=source,
+            CopySourceRange=f'bytes={start}-{end}',
+            CopySourceIfMatch=head['ETag']
+        )
+        return {'PartNumber': part_number, 'ETag': response['CopyPartResult']['ETag']}
+
+    try:
+        parts = await bounded_map(copy_part, range(1, math.ceil(size / part_size) + 1), concurrency)
+        return await s3.complete_multipart_upload(Bucket=bucket, Key=dest_key, UploadId=upload_id, MultipartUpload={'Parts': parts})
+    except BaseException:
+        await s3.abort_multipart_upload(Bucket=bucket, Key=dest_key, UploadId=upload_id)
+        raise
+
+async def copy_prefix(s3, bucket, source_prefix, dest_prefix, concurrency=s3_bulk.DEFAULT_WORKERS, progress=None, copied=None):
+    """ Copy every object under source_prefix to the same relative key under dest_prefix """
+    s3_bulk.check_prefix_target(source_prefix, dest_prefix)
+
+    async def copy(obj):
+        source_key = obj['Key']
+        extra = {'StorageClass': obj['StorageClass']} if obj.get('StorageClass', 'STANDARD') != 'STANDARD' else {}
+        try:
+            await copy_object(s3, bucket, source_key, dest_prefix + source_key[len(source_prefix):], obj['Size'], **extra)
+        except Exception as e:
+            return 0, [{'Key': source_key, 'Code': type(e).__name__, 'Message': str(e)}]
+        if copied is not None:
+            copied.append(source_key)
+        return 1, []
+
+    return await run_bounded(iter_objects(s3, bucket, source_prefix), copy, concurrency, progress)
+
+async def move_prefix(s3, bucket, source_prefix, dest_prefix, concurrency=s3_bulk.DEFAULT_WORKERS, progress=None):
+    """ Copy a prefix, then delete the sources that were copied; returns (copy result, delete result) """
+    copied = []
+    copy_result = await copy_prefix(s3, bucket, source_prefix, dest_prefix, concurrency, progress, copied)
+    delete_result = await delete_keys(s3, bucket, copied, concurrency)
+    return copy_result, delete_result
+
+async def list_level(s3, bucket, prefix):
+    """ One delimiter listing: (stats of the objects directly under prefix, child prefixes) """
+    direct = prefix_stats.PrefixStats()
+    children = []
+    paginator = s3.get_paginator('list_objects_v2')
+    async for page in paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter='/'):
+        for obj in page.get('Contents', []):
+            direct.add_object(obj)
+        children.extend(cp['Prefix'] for cp in page.get('CommonPrefixes', []))
+    return direct, children
+
+async def list_subtree(s3, bucket, prefix):
+    stats = prefix_stats.PrefixStats()
+    async for obj in iter_objects(s3, bucket, prefix):
+        stats.add_object(obj)
+    return stats
+
+async def compute_stats(s3, bucket, prefix, cache=None, concurrency=prefix_stats.DEFAULT_WORKERS,
+                        split_depth=prefix_stats.DEFAULT_SPLIT_DEPTH, progress=None):
+    """ Async prefix_stats.compute_stats: sub-prefixes of each level are listed concurrently """
+    walk = prefix_stats.StatsWalk(bucket, prefix, cache, split_depth)
+    for depth, pending, flat in walk.levels():
+        if flat:
+            walk.add_subtrees(pending, await bounded_map(lambda node: list_subtree(s3, bucket, node), pending, concurrency))
+            break
+        walk.add_levels(pending, await bounded_map(lambda node: list_level(s3, bucket, node), pending, concurrency))
+        if progress:
+            progress(walk.progress(depth))
+    return walk.summary()
+
+async def run_load(s3, bucket, prefix, spec, job=None):
+    """ Async loadgen.run_load: `spec.concurrency` put_object calls in flight """
+    block = loadgen.generate_jibberish_content(loadgen.PAYLOAD_BLOCK_SIZE, random.Random(spec.seed)).encode()
+    stats = loadgen.LoadStats()
+
+    async def put(task):
+        key, size = task
+        body = loadgen.make_payload(block, size)
+        started = time.perf_counter()
+        try:
+            await s3.put_object(Bucket=bucket, Key=key, Body=body)
+        except Exception as e:
+            stats.record_error()
+            return 0, [{'Key': key, 'Code': type(e).__name__, 'Message': str(e)}]
+        stats.record(time.perf_counter() - started, size)
+        return 1, []
+
+    def progress(result):
+        if job is not None and result.total % 100 == 0:
+            job.progress = stats.summary()
+
+    result = await run_bounded(loadgen.plan_objects(prefix, spec), put, spec.concurrency, progress)
+    summary = stats.summary()
+    summary['spec'] = spec.to_dict()
+    summary['sample_errors'] = result.errors[:10]
+    if job is not None:
+        job.progress = summary
+    return summary
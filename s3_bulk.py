@@ -0,0 +1,132 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import s3_transfer
+
+"""
+Bulk S3 Operations
+==================
+
+Helpers for operations that touch every object under a prefix. Keys are
+paged through with the list_objects_v2 paginator, so prefixes of any size are
+covered, and the per-batch requests are fanned out over a bounded worker pool.
+
+Copies and moves are server-side (see s3_transfer.copy_object), one object per
+worker; a move deletes the sources that were copied once the copy phase is done.
+"""
+
+# S3 accepts at most 1000 keys per DeleteObjects request
+DELETE_BATCH_SIZE = 1000
+DEFAULT_WORKERS = 8
+
+class BulkResult:
+    """ Running totals for a bulk operation """
+    def __init__(self):
+        self.succeeded = 0
+        self.errors = []
+
+    @property
+    def failed(self):
+        return len(self.errors)
+
+    @property
+    def total(self):
+        return self.succeeded + self.failed
+
+def iter_objects(s3, bucket, prefix):
+    """ Yield the list_objects_v2 entry of every object under a prefix """
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        yield from page.get('Contents', [])
+
+def iter_keys(s3, bucket, prefix):
+    """ Yield every key under a prefix, following continuation tokens """
+    for obj in iter_objects(s3, bucket, prefix):
+        yield obj['Key']
+
+def iter_batches(items, size):
+    """ Group an iterable into lists of at most `size` items """
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def run_batches(batches, handler, workers=DEFAULT_WORKERS, progress=None):
+    """ Run handler(batch) -> (succeeded, errors) over a bounded worker pool """
+    result = BulkResult()
+
+    def collect(futures):
+        for future in futures:
+            succeeded, errors = future.result()
+            result.succeeded += succeeded
+            result.errors.extend(errors)
+            if progress:
+                progress(result)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for batch in batches:
+            # Keep at most two batches queued per worker so huge prefixes are
+            # never materialised in memory ahead of the deletes
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(pool.submit(handler, batch))
+        collect(wait(pending).done)
+    return result
+
+def delete_batch(s3, bucket, keys):
+    """ Delete up to 1000 keys with a single DeleteObjects call """
+    try:
+        response = s3.delete_objects(
+            Bucket=bucket,
+            Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True}
+        )
+    except Exception as e:
+        return 0, [{'Key': key, 'Code': type(e).__name__, 'Message': str(e)} for key in keys]
+    errors = response.get('Errors', [])
+    return len(keys) - len(errors), errors
+
+def delete_keys(s3, bucket, keys, workers=DEFAULT_WORKERS, progress=None):
+    """ Delete an iterable of keys in DeleteObjects batches """
+    batches = iter_batches(keys, DELETE_BATCH_SIZE)
+    return run_batches(batches, lambda batch: delete_batch(s3, bucket, batch), workers, progress)
+
+def delete_prefix(s3, bucket, prefix, workers=DEFAULT_WORKERS, progress=None):
+    """ Delete every object under a prefix """
+    return delete_keys(s3, bucket, iter_keys(s3, bucket, prefix), workers, progress)
+
+def check_prefix_target(source_prefix, dest_prefix):
+    if dest_prefix.startswith(source_prefix):
+        # The listing would pick up the copies it has just made
+        raise ValueError(f'Cannot copy {source_prefix} into itself ({dest_prefix})')
+
+def copy_prefix(s3, bucket, source_prefix, dest_prefix, workers=DEFAULT_WORKERS, progress=None, copied=None):
+    """ Copy every object under source_prefix to the same relative key under dest_prefix
+
+    The source key of every successful copy is appended to `copied` when given.
+    """
+    check_prefix_target(source_prefix, dest_prefix)
+
+    def copy(obj):
+        source_key = obj['Key']
+        try:
+            extra = {'StorageClass': obj['StorageClass']} if obj.get('StorageClass', 'STANDARD') != 'STANDARD' else {}
+            s3_transfer.copy_object(s3, bucket, source_key, dest_prefix + source_key[len(source_prefix):], obj['Size'], **extra)
+        except Exception as e:
+            return 0, [{'Key': source_key, 'Code': type(e).__name__, 'Message': str(e)}]
+        if copied is not None:
+            copied.append(source_key)
+        return 1, []
+
+    return run_batches(iter_objects(s3, bucket, source_prefix), copy, workers, progress)
+
+def move_prefix(s3, bucket, source_prefix, dest_prefix, workers=DEFAULT_WORKERS, progress=None):
+    """ Copy a prefix, then delete the sources that were copied; returns (copy result, delete result) """
+    copied = []
+    copy_result = copy_prefix(s3, bucket, source_prefix, dest_prefix, workers, progress, copied)
+    # Sources that failed to copy are left in place
+    delete_result = delete_keys(s3, bucket, copied, workers)
+    return copy_result, delete_result
@@ -0,0 +1,135 @@
+import os
+import json
+import threading
+import boto3
+from botocore.config import Config
+import urllib3
+
+"""
+Shared S3 Client Factory
+========================
+
+Builds the S3 client used by app.py, check.py and the bulk helpers (and the
+aiobotocore client used by async_app.py) from one place. Settings come from
+the "s3" section of config.json and can be overridden with environment
+variables:
+
+   S3_ENDPOINT_URL, S3_BUCKET, AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY,
+   AWS_REGION, S3_VERIFY_SSL, S3_MAX_POOL_CONNECTIONS, S3_MAX_ATTEMPTS,
+   S3_RETRY_MODE, S3_CONNECT_TIMEOUT, S3_READ_TIMEOUT, S3_TCP_KEEPALIVE
+
+botocore clients are thread-safe, so a single client (and its connection pool)
+is shared by every Flask worker thread and every bulk-operation worker. Size
+max_pool_connections to cover both, or requests queue waiting for a socket.
+
+The editor saves with put_object(IfMatch=...) so it never overwrites someone
+else's change. botocore only accepts IfMatch on put_object from 1.35.68
+(boto3 1.35.68, November 2024); with an older one every guarded save fails
+with a parameter validation error.
+"""
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.json')
+
+DEFAULTS = {
+    'endpoint_url': 'https://s3.amazonaws.com',
+    'bucket_name': '',
+    'aws_access_key_id': '',
+    'aws_secret_access_key': '',
+    'region_name': '',
+    'verify': False,
+    'max_pool_connections': 50,
+    'retry_mode': 'adaptive',
+    'max_attempts': 10,
+    'connect_timeout': 5,
+    'read_timeout': 60,
+    'tcp_keepalive': True,
+}
+
+ENV_OVERRIDES = {
+    'endpoint_url': 'S3_ENDPOINT_URL',
+    'bucket_name': 'S3_BUCKET',
+    'aws_access_key_id': 'AWS_ACCESS_KEY_ID',
+    'aws_secret_access_key': 'AWS_SECRET_ACCESS_KEY',
+    'region_name': 'AWS_REGION',
+    'verify': 'S3_VERIFY_SSL',
+    'max_pool_connections': 'S3_MAX_POOL_CONNECTIONS',
+    'retry_mode': 'S3_RETRY_MODE',
+    'max_attempts': 'S3_MAX_ATTEMPTS',
+    'connect_timeout': 'S3_CONNECT_TIMEOUT',
+    'read_timeout': 'S3_READ_TIMEOUT',
+    'tcp_keepalive': 'S3_TCP_KEEPALIVE',
+}
+
+_client = None
+_client_lock = threading.Lock()
+
+def _coerce(value, default):
+    """ Convert an environment variable string to the type of its default """
+    if isinstance(default, bool):
+        if value.lower() in ('1', 'true', 'yes', 'on'):
+            return True
+        if value.lower() in ('0', 'false', 'no', 'off'):
+            return False
+        # verify may also be the path of a CA bundle
+        return value
+    if isinstance(default, int):
+        return int(value)
+    return value
+
+def load_settings(config_file=CONFIG_FILE):
+    """ Merge defaults, the "s3" section of config.json and environment overrides """
+    settings = dict(DEFAULTS)
+    if os.path.exists(config_file):
+        with open(config_file) as f:
+            settings.update(json.load(f).get('s3', {}))
+    for name, variable in ENV_OVERRIDES.items():
+        if variable in os.environ:
+            settings[name] = _coerce(os.environ[variable], DEFAULTS[name])
+    return settings
+
+def _client_options(settings, overrides):
+    settings = dict(settings or load_settings())
+    settings.update(overrides)
+    if settings['verify'] is False:
+        # Suppress only the single InsecureRequestWarning from urllib3 needed
+        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+    config = {
+        'signature_version': 's3v4',
+        'max_pool_connections': settings['max_pool_connections'],
+        'retries': {'mode': settings['retry_mode'], 'max_attempts': settings['max_attempts']},
+        'connect_timeout': settings['connect_timeout'],
+        'read_timeout': settings['read_timeout'],
+        'tcp_keepalive': settings['tcp_keepalive'],
+    }
+    client_args = {
+        # Empty values fall back to the standard AWS credential/region chain
+        'aws_access_key_id': settings['aws_access_key_id'] or None,
+        'aws_secret_access_key': settings['aws_secret_access_key'] or None,
+        'region_name': settings['region_name'] or None,
+        'endpoint_url': settings['endpoint_url'] or None,
+        'verify': settings['verify'],
+    }
+    return config, client_args
+
+def create_client(settings=None, **overrides):
+    """ Build a new S3 client with pooling, retry and timeout settings applied """
+    config, client_args = _client_options(settings, overrides)
+    # Sessions are not thread-safe, so each client gets its own
+    session = boto3.session.Session()
+    return session.client('s3', config=Config(**config), **client_args)
+
+def create_async_client(settings=None, **overrides):
+    """ Async context manager yielding an aiobotocore S3 client with the same settings (requires aiobotocore) """
+    from aiobotocore.session import get_session
+    from aiobotocore.config import AioConfig
+    config, client_args = _client_options(settings, overrides)
+    return get_session().create_client('s3', config=AioConfig(**config), **client_args)
+
+def get_client():
+    """ Return the process-wide shared S3 client, creating it on first use """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = create_client()
+    return _client
@@ -0,0 +1,230 @@
+import math
+from urllib.parse import urlencode, quote
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+"""
+S3 Transfer Helpers
+===================
+
+Multipart upload engine used by the upload routes. Data is read from a stream
+in part-sized chunks and each part is uploaded on a bounded worker pool, so a
+large upload uses several connections while only `workers` parts are held in
+memory at a time. Incomplete uploads are aborted on failure.
+
+Server-side copies use CopyObject up to its 5 GiB limit and a multipart upload
+of UploadPartCopy ranges above it; object data never leaves S3.
+"""
+
+MB = 1024 * 1024
+
+# Streams smaller than this are sent with a single put_object
+MULTIPART_THRESHOLD = 16 * MB
+# S3 requires every part except the last to be at least 5 MiB
+MIN_PART_SIZE = 5 * MB
+PART_SIZE = 16 * MB
+MAX_PARTS = 10000
+DEFAULT_WORKERS = 8
+
+# CopyObject handles sources up to 5 GiB; larger ones are copied in parts
+MAX_COPY_OBJECT_SIZE = 5 * 1024 * MB
+COPY_PART_SIZE = 512 * MB
+# Headers a multipart copy has to carry over itself (CopyObject copies them by default)
+COPIED_HEADERS = ('ContentType', 'ContentEncoding', 'ContentDisposition', 'ContentLanguage',
+                  'CacheControl', 'Expires', 'Metadata', 'StorageClass')
+
+def tagging_header(tag_set):
+    """ The Tagging parameter of a create_multipart_upload for a get_object_tagging TagSet """
+    return urlencode([(tag['Key'], tag['Value']) for tag in tag_set], quote_via=quote)
+
+def choose_part_size(size=None, part_size=PART_SIZE):
+    """ Grow the part size when needed so an object of `size` bytes fits in MAX_PARTS parts """
+    part_size = max(part_size, MIN_PART_SIZE)
+    if size:
+        part_size = max(part_size, math.ceil(size / MAX_PARTS))
+    return part_size
+
+def read_up_to(stream, size):
+    """ Read until `size` bytes have been collected or the stream ends """
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+class MultipartUploader:
+    """ Write bytes into a multipart upload, uploading full parts concurrently """
+    def __init__(self, s3, bucket, key, part_size=PART_SIZE, workers=DEFAULT_WORKERS, **extra):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.part_size = choose_part_size(part_size=part_size)
+        self.workers = workers
+        self.upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key, **extra)['UploadId']
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.pending = set()
+        self.parts = []
+        self.part_number = 0
+        self.buffer = bytearray()
+        self.bytes_written = 0
+        self.completed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.completed:
+            self.abort()
+        return False
+
+    def write(self, data):
+        self.buffer += data
+        self.bytes_written += len(data)
+        while len(self.buffer) >= self.part_size:
+            part = bytes(self.buffer[:self.part_size])
+            del self.buffer[:self.part_size]
+            self._submit(part)
+
+    def complete(self):
+        # The last part may be short; an empty upload still needs one part
+        if self.buffer or not self.part_number:
+            self._submit(bytes(self.buffer))
+            self.buffer = bytearray()
+        self._collect(wait(self.pending).done)
+        self.pending = set()
+        self.pool.shutdown()
+        self.parts.sort(key=lambda part: part['PartNumber'])
+        response = self.s3.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={'Parts': self.parts}
+        )
+        self.completed = True
+        return response
+
+    def abort(self):
+        for future in self.pending:
+            future.cancel()
+        self.pool.shutdown(wait=True)
+        self.s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+    def _submit(self, data):
+        # Backpressure: wait for a slot before reading another part into memory
+        if len(self.pending) >= self.workers:
+            done, self.pending = wait(self.pending, return_when=FIRST_COMPLETED)
+            self._collect(done)
+        self.part_number += 1
+        if self.part_number > MAX_PARTS:
+            raise ValueError(f'Upload of {self.key} exceeds {MAX_PARTS} parts; increase the part size')
+        self.pending.add(self.pool.submit(self._upload_part, self.part_number, data))
+
+    def _upload_part(self, part_number, data):
+        response = self.s3.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=data
+        )
+        return {'PartNumber': part_number, 'ETag': response['ETag']}
+
+    def _collect(self, futures):
+        for future in futures:
+            self.parts.append(future.result())
+
+def upload_stream(s3, bucket, key, stream, size=None, threshold=MULTIPART_THRESHOLD,
+                  part_size=PART_SIZE, workers=DEFAULT_WORKERS, **extra):
+    """ Upload a readable stream, switching to multipart above the threshold """
+    head = read_up_to(stream, threshold)
+    if len(head) < threshold:
+        return s3.put_object(Bucket=bucket, Key=key, Body=head, **extra)
+    part_size = choose_part_size(size, part_size)
+    with MultipartUploader(s3, bucket, key, part_size, workers, **extra) as uploader:
+        uploader.write(head)
+        for chunk in iter(lambda: stream.read(part_size), b''):
+            uploader.write(chunk)
+        return uploader.complete()
+
+def presign_multipart_upload(s3, bucket, key, size, part_size=PART_SIZE, expires_in=3600):
+    """ Start a multipart upload and presign one upload_part URL per part for the browser """
+    part_size = choose_part_size(size, part_size)
+    part_count = max(1, math.ceil(size / part_size))
+    upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key)['UploadId']
+    urls = [
+        s3.generate_presigned_url(
+            'upload_part',
+            Params={'Bucket': bucket, 'Key': key, 'UploadId': upload_id, 'PartNumber': part_number},
+            ExpiresIn=expires_in
+        )
+        for part_number in range(1, part_count + 1)
+    ]
+    return {'key': key, 'upload_id': upload_id, 'part_size': part_size, 'urls': urls}
+
+def complete_presigned_upload(s3, bucket, key, upload_id, parts):
+    """ Complete a browser-driven multipart upload from the part ETags it collected """
+    parts = sorted(
+        ({'PartNumber': int(part['PartNumber']), 'ETag': part['ETag']} for part in parts),
+        key=lambda part: part['PartNumber']
+    )
+    return s3.complete_multipart_upload(
+        Bucket=bucket,
+        Key=key,
+        UploadId=upload_id,
+        MultipartUpload={'Parts': parts}
+    )
+
+def copy_object(s3, bucket, source_key, dest_key, size=None, source_bucket=None,
+                part_size=COPY_PART_SIZE, workers=DEFAULT_WORKERS, **extra):
+    """ Copy one object inside S3, with a multipart copy above MAX_COPY_OBJECT_SIZE
+
+    `extra` is passed to CopyObject only (e.g. StorageClass, which it does not keep).
+    """
+    source = {'Bucket': source_bucket or bucket, 'Key': source_key}
+    if size is None or size > MAX_COPY_OBJECT_SIZE:
+        head = s3.head_object(**source)
+        if head['ContentLength'] > MAX_COPY_OBJECT_SIZE:
+            return multipart_copy(s3, bucket, source, dest_key, head, part_size, workers)
+    return s3.copy_object(Bucket=bucket, Key=dest_key, CopySource=source, **extra)
+
+def multipart_copy(s3, bucket, source, dest_key, head, part_size=COPY_PART_SIZE, workers=DEFAULT_WORKERS):
+    """ Copy an object of any size with concurrent UploadPartCopy ranges """
+    size = head['ContentLength']
+    part_size = choose_part_size(size, part_size)
+    extra = {name: head[name] for name in COPIED_HEADERS if head.get(name)}
+    # CopyObject keeps the source's tags too; a move would otherwise lose them with the source
+    tag_set = s3.get_object_tagging(**source)['TagSet']
+    if tag_set:
+        extra['Tagging'] = tagging_header(tag_set)
+    upload_id = s3.create_multipart_upload(Bucket=bucket, Key=dest_key, **extra)['UploadId']
+
+    def copy_part(part_number):
+        start = (part_number - 1) * part_size
+        end = min(start + part_size, size) - 1
+        response = s3.upload_part_copy(
+            Bucket=bucket,
+            Key=dest_key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            CopySource=source,
+            CopySourceRange=f'bytes={start}-{end}',
+            # Fail instead of stitching together parts of two different versions
+            CopySourceIfMatch=head['ETag']
+        )
+        return {'PartNumber': part_number, 'ETag': response['CopyPartResult']['ETag']}
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(copy_part, range(1, math.ceil(size / part_size) + 1)))
+        return s3.complete_multipart_upload(
+            Bucket=bucket,
+            Key=dest_key,
+            UploadId=upload_id,
+            MultipartUpload={'Parts': parts}
+        )
+    except BaseException:
+        s3.abort_multipart_upload(Bucket=bucket, Key=dest_key, UploadId=upload_id)
+        raise
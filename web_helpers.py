@@ -0,0 +1,273 @@
+import os
+import heapq
+from urllib.parse import quote
+from werkzeug.http import http_date
+import s3_bulk
+
+"""
+Web Helpers
+===========
+
+Request-independent helpers shared by the Flask app (app.py) and the ASGI
+app (async_app.py). Each route does its S3 calls and flashing itself and uses
+these for everything in between: index pages and their cursors, the editor's
+read window, download headers and status codes, and the keys of a copy or move.
+"""
+
+# Bytes of URL-encoded "Previous" cursors carried in index page links. Older
+# cursors are dropped beyond this, so deep pages keep short URLs and walk back
+# with "First" instead.
+MAX_BACK_CURSOR_BYTES = 1536
+
+def parse_page_size(value, default, maximum):
+    """ Page size from a query-string value, clamped to 1..maximum """
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, maximum))
+
+def parse_page_number(value):
+    """ 1-based page number from a query-string value """
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        return 1
+
+def parse_offset(value):
+    """ Non-negative byte offset from a query-string value """
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return 0
+
+def looks_binary(sample):
+    if b'\x00' in sample:
+        return True
+    try:
+        sample.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # The sample may end part-way through a multi-byte character
+        return e.start < len(sample) - 3
+    return False
+
+def get_breadcrumbs(prefix):
+    if not prefix:
+        return []
+    parts = prefix.strip('/').split('/')
+    breadcrumbs = [{'name': 'Home', 'prefix': ''}]
+    for i, part in enumerate(parts):
+        breadcrumbs.append({'name': part, 'prefix': '/'.join(parts[:i + 1]) + '/'})
+    return breadcrumbs
+
+def page_entries(page, prefix, start_after=''):
+    """ Folders and files of one delimiter listing page, merged in key order, after the cursor """
+    folders = ((cp['Prefix'], 'folder') for cp in page.get('CommonPrefixes', []))
+    files = ((obj['Key'], 'file') for obj in page.get('Contents', []) if obj['Key'] != prefix)
+    # When the cursor is a folder, S3 rolls its children back up into the same
+    # CommonPrefix on the next page, so skip anything not strictly after it.
+    return [(name, kind) for name, kind in heapq.merge(folders, files) if not start_after or name > start_after]
+
+class FolderListing:
+    """ One index page of a folder, filled from list_objects_v2 delimiter pages
+
+    Pages are requested `limit` entries at a time, so a page of up to 1000 entries
+    costs one LIST call; whether another page follows comes from the entries left
+    over or the last page's IsTruncated flag.
+    """
+    def __init__(self, prefix, start_after='', limit=1000):
+        self.prefix = prefix
+        self.start_after = start_after
+        self.limit = limit
+        self.folders = []
+        self.files = []
+        self.next_cursor = None
+        self.last = start_after
+
+    def list_params(self, bucket):
+        params = {'Bucket': bucket, 'Prefix': self.prefix, 'Delimiter': '/'}
+        if self.start_after:
+            params['StartAfter'] = self.start_after
+        # A folder cursor comes back once as a CommonPrefix and is skipped
+        page_size = self.limit + 1 if self.start_after.endswith('/') else self.limit
+        params['PaginationConfig'] = {'PageSize': min(page_size, 1000)}
+        return params
+
+    def add(self, page):
+        """ Take the entries of one listing page; True once the index page is complete """
+        for name, kind in page_entries(page, self.prefix, self.start_after):
+            if len(self.folders) + len(self.files) == self.limit:
+                self.next_cursor = self.last
+                return True
+            (self.folders if kind == 'folder' else self.files).append(name)
+            self.last = name
+        if len(self.folders) + len(self.files) == self.limit:
+            if page.get('IsTruncated'):
+                self.next_cursor = self.last
+            return True
+        return False
+
+    def result(self):
+        return self.folders, self.files, self.next_cursor
+
+def trim_back_cursors(back, max_bytes=MAX_BACK_CURSOR_BYTES):
+    """ The newest "Previous" cursors whose encoded query arguments fit in max_bytes """
+    kept = []
+    used = 0
+    for cursor in reversed(back):
+        used += len('&back=') + len(quote(cursor, safe=''))
+        if used > max_bytes:
+            break
+        kept.append(cursor)
+    return kept[::-1]
+
+def page_links(url_for, prefix, limit, after, back, page_number, next_cursor):
+    """ next_url/prev_url/first_url/page_number for index.html; url_for is the framework's """
+    links = {'next_url': None, 'prev_url': None, 'first_url': None, 'page_number': page_number}
+    if next_cursor:
+        links['next_url'] = url_for('index', prefix=prefix, after=next_cursor, back=trim_back_cursors(back + [after]),
+                                    page=page_number + 1, page_size=limit)
+    if back:
+        links['prev_url'] = url_for('index', prefix=prefix, after=back[-1] or None, back=back[:-1],
+                                    page=max(1, page_number - 1), page_size=limit)
+    if page_number > 1 or after:
+        links['first_url'] = url_for('index', prefix=prefix, page_size=limit)
+    return links
+
+def parent_prefix(key):
+    return '/'.join(key.split('/')[:-1])
+
+def resolve_key(prefix, name):
+    # Names are relative to the current folder unless they start with '/'
+    return name[1:] if name.startswith('/') else f'{prefix}{name}'
+
+def resolve_transfer(prefix, operation, source, destination):
+    """ (source, destination, is_folder) of a copy or move form; raises ValueError when invalid """
+    source = resolve_key(prefix, source.strip())
+    destination = resolve_key(prefix, destination.strip())
+    is_folder = source.endswith('/')
+    if is_folder and not destination.endswith('/'):
+        destination += '/'
+    elif not is_folder and destination.endswith('/'):
+        # Copying a file into a folder keeps its name
+        destination += source.split('/')[-1]
+    if operation not in ('copy', 'move'):
+        raise ValueError(f'Unknown operation: {operation}')
+    if not source or not destination or source == destination:
+        raise ValueError('Source and destination must be different keys.')
+    if is_folder:
+        s3_bulk.check_prefix_target(source, destination)
+    return source, destination, is_folder
+
+def transfer_summary(copy_result, delete_result=None):
+    """ Job result of a folder copy or move """
+    return {
+        'copied': copy_result.succeeded,
+        'failed': copy_result.failed,
+        'deleted': delete_result.succeeded if delete_result else 0,
+        'delete_failed': delete_result.failed if delete_result else 0,
+        'sample_errors': (copy_result.errors + (delete_result.errors if delete_result else []))[:10],
+    }
+
+def empty_edit_view(key):
+    """ edit.html context for an object that could not be read """
+    return {'key': key, 'content': '', 'etag': None, 'size': 0, 'editable': False, 'binary': False,
+            'offset': 0, 'prev_offset': None, 'next_offset': None}
+
+def edit_window(size, offset, max_inline, window_size):
+    """ (start, end) of the bytes the editor shows; end is None when the whole object is read and editable """
+    if size <= max_inline:
+        return 0, None
+    start = min(offset, size - 1)
+    return start, min(start + window_size, size) - 1
+
+def build_edit_view(key, head, data, start, end, sample, window_size):
+    """ edit.html context and (message, category) flashes for the bytes read at start..end """
+    size = head['ContentLength']
+    view = empty_edit_view(key)
+    view.update(size=size, etag=head['ETag'])
+    messages = []
+    if end is None:
+        view['editable'] = True
+    else:
+        view.update(offset=start,
+                    prev_offset=max(0, start - window_size) if start else None,
+                    next_offset=end + 1 if end + 1 < size else None)
+        messages.append((f'This file is {size} bytes; showing a read-only window of {len(data)} bytes.', 'info'))
+    binary = looks_binary(sample)
+    if not binary and end is None:
+        # Saving replaces the whole object, so every byte must round-trip, not just the sniffed ones
+        try:
+            view['content'] = data.decode('utf-8')
+        except UnicodeDecodeError:
+            binary = True
+    elif not binary:
+        view['content'] = data.decode('utf-8', errors='replace')
+    if binary:
+        view.update(binary=True, editable=False)
+        messages.append(('This file looks binary and cannot be shown inline. Download it instead.', 'warning'))
+    return view, messages
+
+def save_error(error):
+    """ (message, conflict) for an editor save that failed; conflict when the object changed underneath """
+    code = getattr(error, 'response', {}).get('Error', {}).get('Code')
+    if code in ('PreconditionFailed', 'ConditionalRequestConflict'):
+        return 'The file was changed by someone else since you opened it. Your edits were not saved.', True
+    if 'IfMatch' in str(error) and 'Unknown parameter' in str(error):
+        return ('This boto3/botocore is too old for conditional saves (needs 1.35.68 or newer). '
+                'Your edits were not saved; upgrade it or choose Overwrite Anyway.'), True
+    return f'Error updating file: {error}. Your edits were not saved.', False
+
+def download_params(bucket, key, headers):
+    """ get_object parameters for a download request """
+    params = {'Bucket': bucket, 'Key': key}
+    # Pass Range, If-Range and If-None-Match on to S3 so it does the slicing and ETag checks
+    if headers.get('Range'):
+        if_range = headers.get('If-Range')
+        if not if_range:
+            params['Range'] = headers['Range']
+        elif if_range.startswith('"'):
+            # Resuming: only send the range if the object still has the client's ETag
+            params['Range'] = headers['Range']
+            params['IfMatch'] = if_range
+        # A weak ETag or a date in If-Range cannot be checked exactly, so the whole object is sent
+    if headers.get('If-None-Match'):
+        params['IfNoneMatch'] = headers['If-None-Match']
+    return params
+
+def range_validator_failed(error, params):
+    """ Whether get_object failed only because the If-Range ETag no longer matches """
+    return 'IfMatch' in params and error.get('Code') in ('412', 'PreconditionFailed')
+
+def full_download_params(params):
+    """ The parameters of params without the range and its If-Range check """
+    return {name: value for name, value in params.items() if name not in ('Range', 'IfMatch')}
+
+def download_error_response(error, headers):
+    """ (status, headers) to answer a get_object error with, or None when it is a real failure """
+    if error.get('Code') in ('304', 'NotModified'):
+        return 304, {'ETag': headers['If-None-Match']}
+    # HEAD errors carry no body, so their code is only the HTTP status
+    if error.get('Code') in ('416', 'InvalidRange'):
+        response_headers = {}
+        if error.get('ActualObjectSize'):
+            response_headers['Content-Range'] = f"bytes */{error['ActualObjectSize']}"
+        return 416, response_headers
+    return None
+
+def download_headers(key, response):
+    """ (status, headers) of a streamed download from a get_object response """
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'Content-Length': str(response['ContentLength']),
+        'Content-Disposition': f"attachment; filename*=UTF-8''{quote(os.path.basename(key))}",
+    }
+    if response.get('ETag'):
+        headers['ETag'] = response['ETag']
+    if response.get('LastModified'):
+        headers['Last-Modified'] = http_date(response['LastModified'])
+    status = 200
+    if response.get('ContentRange'):
+        headers['Content-Range'] = response['ContentRange']
+        status = 206
+    return status, headers